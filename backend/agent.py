@@ -1,68 +1,167 @@
 """Intelligent agent with LLM-powered reasoning and precedent awareness"""
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from models import Message, Decision
-from embeddings import get_embedding, cosine_similarity
-from retriever import HybridRetriever
-from llm import get_llm_client
+from embeddings import get_embedding, aget_cached_embedding_array, cosine_similarity
+from semantic_cache import get_suggestion_cache
+from intent_classifier import get_intent_classifier
+from retriever import get_hybrid_retriever
 from prompts import (
     build_email_draft_prompt, 
     build_intent_analysis_prompt,
-    get_tone_description,
-    get_sender_context
+    build_suggestion_system_prompt,
+    build_suggestion_prompt,
+    get_tone_description
 )
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, AsyncIterator
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from functools import cached_property
+from cachetools import LRUCache
+import asyncio
+import hashlib
 import json
+import threading
+
+# Precedent agreement that skips message analysis and the LLM decision
+PRECEDENT_MIN_SAMPLES = 3
+PRECEDENT_AGREEMENT = 0.8
+
+# Message analyses keyed by content digest; shared process-wide
+_analysis_cache = LRUCache(maxsize=2048)
+_analysis_cache_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Precedent:
+    """Lightweight view of a past decision: just what prompts and voting read"""
+    id: str
+    human_action: Dict
+    timestamp: datetime
+    sender_name: str
+    sender_type: str
+    snippet: str
 
 
 class AgentEngine:
-    """Sophisticated agent that uses LLM reasoning + hybrid retrieval + precedent learning"""
+    """Sophisticated agent that uses LLM reasoning + hybrid retrieval + precedent learning
     
-    def __init__(self, db: Session, use_llm: bool = True):
-        self.db = db
-        self.retriever = HybridRetriever(db)
-        self.use_llm = use_llm
-        if use_llm:
-            try:
-                self.llm = get_llm_client()
-                print("✅ AgentEngine initialized with LLM")
-            except Exception as e:
-                print(f"⚠️  LLM unavailable, falling back to heuristics: {e}")
-                self.use_llm = False
-        else:
-            print("⚠️  AgentEngine initialized without LLM (heuristics only)") 
+    Stateless between requests: one instance serves the process, and the
+    session and LLM switch are passed to each call.
+    """
+    
+    @cached_property
+    def retriever(self):
+        """Shared hybrid retriever"""
+        return get_hybrid_retriever()
     
-    def get_suggestion(self, message: Message) -> dict:
-        """Generate intelligent action/tone suggestion with deep context understanding"""
+    @cached_property
+    def llm(self):
+        """LLM client, connected on first use
+        
+        Every call site already falls back to heuristics if this raises.
+        """
+        from llm import get_llm_client
+        return get_llm_client()
+    
+    async def _connect_llm(self) -> None:
+        """Create the LLM client off the event loop (connection check and
+        model load are blocking), so later self.llm accesses are free"""
+        await asyncio.to_thread(getattr, self, "llm")
+    
+    async def get_suggestion(
+        self,
+        db: Session,
+        message: Message,
+        use_llm: bool = True,
+        include_draft: bool = True
+    ) -> dict:
+        """Generate intelligent action/tone suggestion with deep context understanding
+        
+        Args:
+            db: Database session
+            message: Message to analyze
+            use_llm: Use LLM reasoning (False = precedent voting and heuristics only)
+            include_draft: Generate the draft inline; pass False and use
+                stream_draft to get it token by token instead
+        """
+        
+        # Near-duplicate messages (templated blasts, repeats) reuse a prior
+        # suggestion; drafts address the sender by name, so a suggestion
+        # carrying one is only reused for the same sender
+        cache = get_suggestion_cache()
+        cache_key = (
+            message.sender_type,
+            use_llm,
+            include_draft,
+            message.sender_name if use_llm and include_draft else None
+        )
+        message_embedding = message.embedding
+        if message_embedding is None:
+            message_embedding = await aget_cached_embedding_array(message.content)
+        cached = cache.lookup(cache_key, message_embedding)
+        if cached is not None:
+            return cached
         
-        # Step 1: Analyze message intent and extract key information
-        message_analysis = self._analyze_message(message)
+        if use_llm:
+            await self._connect_llm()
         
-        # Step 2: Retrieve relevant context using hybrid strategy
-        retrieved_context = self._retrieve_context(message, message_analysis)
+        # Steps 1-2: Retrieve relevant context using hybrid strategy, then the
+        # past decisions it references (embedding, BM25, reranking and the
+        # sync session are blocking; keep them off the event loop)
+        retrieved_context, similar_decisions = await asyncio.to_thread(
+            self._gather_context, db, message
+        )
         
-        # Step 3: Get past decisions for this sender type
-        similar_decisions = self._get_similar_decisions(message, retrieved_context)
+        # Step 3: Analyze message intent, unless consistent precedent already
+        # settles the outcome (analysis rarely changes it, and costs an LLM call)
+        confident = self._is_confident_precedent(similar_decisions)
+        message_analysis = {} if confident else await self._analyze_message(
+            message, message_embedding, use_llm
+        )
         
         # Step 4: Make intelligent decision using LLM reasoning
-        if self.use_llm and similar_decisions:
-            action, tone, reasoning = self._llm_based_suggestion(
+        draft_response = None
+        draft_enabled = use_llm and include_draft
+        if use_llm and similar_decisions and not confident:
+            llm_suggestion = self._llm_based_suggestion(
                 message, message_analysis, similar_decisions, retrieved_context
             )
-        elif similar_decisions:
-            # Fallback: Use precedent voting
-            action, tone, reasoning = self._precedent_voting(
-                similar_decisions, message.sender_type
-            )
+            if draft_enabled:
+                # The draft depends only on tone, so draft speculatively with the
+                # tone precedent voting predicts while the LLM reasons, and redo
+                # it only if the final tone disagrees
+                _, predicted_tone, _ = self._precedent_voting(
+                    similar_decisions, message.sender_type
+                )
+                (action, tone, reasoning), draft_response = await asyncio.gather(
+                    llm_suggestion,
+                    self._generate_draft(
+                        message, message_analysis, retrieved_context, predicted_tone
+                    )
+                )
+                if tone != predicted_tone:
+                    draft_response = await self._generate_draft(
+                        message, message_analysis, retrieved_context, tone
+                    )
+            else:
+                action, tone, reasoning = await llm_suggestion
         else:
-            # Fallback: Use basic heuristics
-            action, tone, reasoning = self._fallback_heuristics(message, message_analysis)
-        
-        # Step 5: Generate draft response if LLM is available
-        draft_response = None
-        if self.use_llm:
-            draft_response = self._generate_draft(
-                message, message_analysis, retrieved_context, tone
-            )
+            if similar_decisions:
+                # Fallback: Use precedent voting
+                action, tone, reasoning = self._precedent_voting(
+                    similar_decisions, message.sender_type
+                )
+            else:
+                # Fallback: Use basic heuristics
+                action, tone, reasoning = self._fallback_heuristics(message, message_analysis)
+            
+            # Step 5: Generate draft response if LLM is available
+            if draft_enabled:
+                draft_response = await self._generate_draft(
+                    message, message_analysis, retrieved_context, tone
+                )
         
         result = {
             "action": action,
@@ -70,19 +169,34 @@ class AgentEngine:
             "reasoning": reasoning,
             "precedent_count": len(similar_decisions),
             "similar_decisions": [d.id for d in similar_decisions],
-            "message_analysis": message_analysis,
+            "message_analysis": message_analysis or None,
             "context_sources": [r.get("source") for r in retrieved_context[:3]]
         }
         
         if draft_response:
             result["draft_response"] = draft_response
         
+        cache.add(cache_key, message_embedding, result)
         return result
     
-    def _analyze_message(self, message: Message) -> Dict:
+    def _gather_context(
+        self,
+        db: Session,
+        message: Message
+    ) -> Tuple[List[Dict], List[Precedent]]:
+        """Retrieved context plus the precedents it references (blocking)"""
+        retrieved_context = self._retrieve_context(db, message)
+        return retrieved_context, self._get_similar_decisions(db, message, retrieved_context)
+    
+    async def _analyze_message(
+        self,
+        message: Message,
+        embedding=None,
+        use_llm: bool = True
+    ) -> Dict:
         """Deeply analyze message to extract intent, urgency, topics, and sentiment"""
         
-        if not self.use_llm:
+        if not use_llm:
             return {
                 "intent": "unknown",
                 "topics": ["general"],
@@ -90,55 +204,79 @@ class AgentEngine:
                 "requires_action": False
             }
         
+        # Confident embedding classification avoids the LLM round-trip
+        classifier = get_intent_classifier()
+        if classifier is not None and embedding is not None:
+            analysis = classifier.predict(embedding)
+            if analysis is not None:
+                return analysis
+        
+        analysis = await self.analyze_with_llm(message)
+        if analysis is None:
+            return {
+                "intent": "general_inquiry",
+                "topics": ["general"],
+                "urgency": "medium",
+                "requires_action": True
+            }
+        return analysis
+    
+    async def analyze_with_llm(self, message: Message) -> Optional[Dict]:
+        """Analyze message with the LLM; None if the call or parse fails"""
+        cache_key = hashlib.blake2b(message.content.encode(), digest_size=16).digest()
+        with _analysis_cache_lock:
+            cached = _analysis_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+        
         try:
             analysis_prompt = build_intent_analysis_prompt(message.content)
-            response = self.llm.generate(
+            response = await self.llm.agenerate(
                 prompt=analysis_prompt,
                 temperature=0.3,  # Lower temp for more consistent analysis
-                max_tokens=200
+                max_tokens=200,
+                json_mode=True
             )
             
-            # Parse LLM response
-            analysis = {}
-            for line in response.split('\n'):
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip().lower()
-                    value = value.strip()
-                    
-                    if key == "intent":
-                        analysis["intent"] = value
-                    elif key == "topics":
-                        analysis["topics"] = [t.strip() for t in value.split(',')]
-                    elif key == "urgency":
-                        analysis["urgency"] = value
-                    elif key == "action":
-                        analysis["requires_action"] = "yes" in value.lower()
-                        analysis["action_description"] = value
+            # Parse LLM response (JSON mode guarantees an object)
+            parsed = json.loads(response)
+            topics = parsed.get("topics") or ["general"]
+            if isinstance(topics, str):
+                topics = [t.strip() for t in topics.split(',')]
+            analysis = {
+                "intent": str(parsed["intent"]),
+                "topics": [str(t) for t in topics],
+                "urgency": str(parsed.get("urgency", "medium")).lower(),
+                "requires_action": bool(parsed.get("requires_action", False)),
+                "action_description": parsed.get("action_description") or None
+            }
             
+            with _analysis_cache_lock:
+                _analysis_cache[cache_key] = dict(analysis)
             return analysis
             
         except Exception as e:
             print(f"Message analysis error: {e}")
-            return {
-                "intent": "general_inquiry",
-                "topics": ["general"],
-                "urgency": "medium",
-                "requires_action": True
-            }
+            return None
     
-    def _retrieve_context(self, message: Message, analysis: Dict) -> List[Dict]:
+    def _retrieve_context(
+        self,
+        db: Session,
+        message: Message,
+        analysis: Optional[Dict] = None
+    ) -> List[Dict]:
         """Retrieve relevant context using hybrid retrieval"""
         
         # Build rich query combining message content and analyzed topics
         query_parts = [message.content]
-        if analysis.get("topics"):
+        if analysis and analysis.get("topics"):
             query_parts.extend(analysis["topics"])
         
         query = " ".join(query_parts)
         
         try:
             results = self.retriever.retrieve(
+                db,
                 query=query,
                 sender_type=message.sender_type,
                 top_k=10,
@@ -154,106 +292,101 @@ class AgentEngine:
     
     def _get_similar_decisions(
         self, 
+        db: Session,
         message: Message, 
         retrieved_context: List[Dict]
-    ) -> List[Decision]:
-        """Extract Decision objects from retrieved context"""
+    ) -> List[Precedent]:
+        """Extract past decisions referenced by the retrieved context"""
         
-        decision_ids = set()
+        # Ordered dict keys keep the retriever's ranking while deduplicating
+        decision_ids = {}
         for result in retrieved_context:
             if result.get("source") in ["graph", "precedent"]:
                 dec_id = result.get("metadata", {}).get("decision_id")
                 if dec_id:
-                    decision_ids.add(dec_id)
+                    decision_ids[dec_id] = None
         
         if not decision_ids:
             return []
         
-        decisions = (
-            self.db.query(Decision)
-            .filter(Decision.id.in_(decision_ids))
-            .limit(5)
+        # Project only the columns downstream code reads, with a content
+        # snippet instead of the full message body
+        rows = (
+            db.query(
+                Decision.id,
+                Decision.human_action,
+                Decision.timestamp,
+                Message.sender_name,
+                Message.sender_type,
+                func.substr(Message.content, 1, 120).label("snippet")
+            )
+            .join(Message, Decision.message_id == Message.id)
+            .filter(Decision.id.in_(list(decision_ids)))
             .all()
         )
+        decisions = [Precedent(**row._asdict()) for row in rows]
+        
+        # IN (...) returns rows in arbitrary order; restore retrieval rank
+        by_id = {d.id: d for d in decisions}
+        return [by_id[i] for i in decision_ids if i in by_id][:5]
+    
+    def _is_confident_precedent(self, similar_decisions: List[Precedent]) -> bool:
+        """True when enough precedents agree on the same (action, tone)"""
+        if len(similar_decisions) < PRECEDENT_MIN_SAMPLES:
+            return False
         
-        return decisions
+        votes = Counter(
+            (d.human_action["action"], d.human_action["tone"]) for d in similar_decisions
+        )
+        top_count = votes.most_common(1)[0][1]
+        return top_count / len(similar_decisions) >= PRECEDENT_AGREEMENT
     
-    def _llm_based_suggestion(
+    async def _llm_based_suggestion(
         self,
         message: Message,
         analysis: Dict,
-        similar_decisions: List[Decision],
+        similar_decisions: List[Precedent],
         retrieved_context: List[Dict]
     ) -> Tuple[str, str, str]:
         """Use LLM to make sophisticated decision based on all available context"""
         
         # Build comprehensive context for LLM
-        precedent_summary = self._format_precedents(similar_decisions)
+        precedent_summary = self._format_precedents(
+            self._dedupe_precedents(similar_decisions)[:5]
+        )
         context_summary = self._format_context(retrieved_context[:5])
-        sender_context = get_sender_context(message.sender_type)
         
-        prompt = f"""You are an intelligent inbox assistant analyzing a message to suggest the best action.
-
-### Message Details:
-From: {message.sender_name} ({message.sender_type})
-Subject: {message.subject or 'N/A'}
-Content: {message.content}
-
-### Message Analysis:
-- Intent: {analysis.get('intent', 'unknown')}
-- Topics: {', '.join(analysis.get('topics', ['general']))}
-- Urgency: {analysis.get('urgency', 'medium')}
-- Requires Action: {analysis.get('requires_action', False)}
-
-### Sender Context:
-{sender_context}
-
-### Past Decisions (Your Precedents):
-{precedent_summary}
-
-### Related Context:
-{context_summary}
-
-### Your Task:
-Based on ALL the above information, suggest:
-1. **Action**: Choose from [reply_now, reply_later, ignore]
-2. **Tone**: Choose from [warm, neutral, formal]
-3. **Reasoning**: Explain your decision in 2-3 sentences, referencing specific precedents and context.
-
-Consider:
-- The sender's importance and your past interactions
-- The message's urgency and complexity
-- Patterns in your previous decisions
-- The specific intent and topics of this message
-
-Format your response as:
-Action: [your choice]
-Tone: [your choice]
-Reasoning: [your detailed reasoning]"""
-
+        # Invariant instructions go first as the system prompt so the backend
+        # can reuse its cached prefix; only the user block varies per message
+        system_prompt = build_suggestion_system_prompt(message.sender_type)
+        prompt = build_suggestion_prompt(
+            sender_name=message.sender_name,
+            sender_type=message.sender_type,
+            subject=message.subject,
+            content=message.content,
+            analysis=analysis,
+            precedent_summary=precedent_summary,
+            context_summary=context_summary
+        )
+        
         try:
-            response = self.llm.generate(
+            response = await self.llm.agenerate(
                 prompt=prompt,
+                system_prompt=system_prompt,
                 temperature=0.5,  # Balanced creativity
-                max_tokens=300
+                max_tokens=300,
+                json_mode=True
             )
             
-            # Parse LLM response
-            action = "reply_later"
-            tone = "neutral"
-            reasoning = "Analysis pending"
-            
-            for line in response.split('\n'):
-                if line.startswith("Action:"):
-                    suggested_action = line.split(':', 1)[1].strip().lower()
-                    if suggested_action in ["reply_now", "reply_later", "ignore"]:
-                        action = suggested_action
-                elif line.startswith("Tone:"):
-                    suggested_tone = line.split(':', 1)[1].strip().lower()
-                    if suggested_tone in ["warm", "neutral", "formal"]:
-                        tone = suggested_tone
-                elif line.startswith("Reasoning:"):
-                    reasoning = line.split(':', 1)[1].strip()
+            # Parse LLM response; anything off-schema falls back to voting
+            parsed = json.loads(response)
+            action = str(parsed["action"]).strip().lower()
+            tone = str(parsed["tone"]).strip().lower()
+            reasoning = str(parsed["reasoning"]).strip()
+            if action not in ["reply_now", "reply_later", "ignore"]:
+                raise ValueError(f"invalid action {action!r}")
+            if tone not in ["warm", "neutral", "formal"]:
+                raise ValueError(f"invalid tone {tone!r}")
             
             return action, tone, reasoning
             
@@ -261,17 +394,35 @@ Reasoning: [your detailed reasoning]"""
             print(f"LLM suggestion error: {e}")
             return self._precedent_voting(similar_decisions, message.sender_type)
     
-    def _format_precedents(self, decisions: List[Decision]) -> str:
+    def _dedupe_precedents(self, decisions: List[Precedent]) -> List[Precedent]:
+        """Keep the most recent precedent per (action, tone, sender) bucket
+        
+        Identical precedents only cost prompt tokens; survivors keep their
+        retrieval order.
+        """
+        latest = {}
+        for dec in decisions:
+            key = (
+                dec.human_action["action"],
+                dec.human_action["tone"],
+                dec.sender_name
+            )
+            if key not in latest or dec.timestamp > latest[key].timestamp:
+                latest[key] = dec
+        
+        keep = {id(dec) for dec in latest.values()}
+        return [dec for dec in decisions if id(dec) in keep]
+    
+    def _format_precedents(self, decisions: List[Precedent]) -> str:
         """Format past decisions for LLM context"""
         if not decisions:
             return "No past decisions found for this type of message."
         
         formatted = []
         for i, dec in enumerate(decisions[:5], 1):
-            msg = dec.message
             formatted.append(
-                f"{i}. Message from {msg.sender_name} ({msg.sender_type}): "
-                f'"{msg.content[:80]}..." → '
+                f"{i}. Message from {dec.sender_name} ({dec.sender_type}): "
+                f'"{dec.snippet[:80]}..." → '
                 f"You chose: {dec.human_action['action']} with {dec.human_action['tone']} tone"
             )
         
@@ -292,23 +443,16 @@ Reasoning: [your detailed reasoning]"""
     
     def _precedent_voting(
         self,
-        similar_decisions: List[Decision],
+        similar_decisions: List[Precedent],
         sender_type: str
     ) -> Tuple[str, str, str]:
         """Fallback: Vote based on precedent patterns"""
         
-        action_counts = {}
-        tone_counts = {}
+        action_counts = Counter(d.human_action["action"] for d in similar_decisions)
+        tone_counts = Counter(d.human_action["tone"] for d in similar_decisions)
         
-        for decision in similar_decisions:
-            human_action = decision.human_action["action"]
-            human_tone = decision.human_action["tone"]
-            
-            action_counts[human_action] = action_counts.get(human_action, 0) + 1
-            tone_counts[human_tone] = tone_counts.get(human_tone, 0) + 1
-        
-        most_common_action = max(action_counts, key=action_counts.get)
-        most_common_tone = max(tone_counts, key=tone_counts.get)
+        most_common_action = action_counts.most_common(1)[0][0]
+        most_common_tone = tone_counts.most_common(1)[0][0]
         
         n = len(similar_decisions)
         reasoning = (
@@ -364,26 +508,25 @@ Reasoning: [your detailed reasoning]"""
         
         return action, tone, reasoning
     
-    def _generate_draft(
+    def _build_draft_prompts(
         self,
         message: Message,
         analysis: Dict,
         retrieved_context: List[Dict],
         tone: str
-    ) -> Optional[str]:
-        """Generate intelligent email draft using full context"""
-        try:
-            # Build prompt with rich context
-            system_prompt, user_prompt = build_email_draft_prompt(
-                message_content=message.content,
-                sender_name=message.sender_name,
-                sender_type=message.sender_type,
-                retrieved_context=retrieved_context[:3],
-                tone=tone
-            )
-            
-            # Add analysis context to prompt
-            enhanced_prompt = f"""{user_prompt}
+    ) -> Tuple[str, str]:
+        """Build (system_prompt, user_prompt) for the email draft"""
+        # Build prompt with rich context
+        system_prompt, user_prompt = build_email_draft_prompt(
+            message_content=message.content,
+            sender_name=message.sender_name,
+            sender_type=message.sender_type,
+            retrieved_context=retrieved_context[:3],
+            tone=tone
+        )
+        
+        # Add analysis context to prompt
+        enhanced_prompt = f"""{user_prompt}
 
 ### Additional Context:
 - Message Intent: {analysis.get('intent', 'general')}
@@ -391,10 +534,25 @@ Reasoning: [your detailed reasoning]"""
 - Urgency: {analysis.get('urgency', 'medium')}
 
 Write a {get_tone_description(tone)} response that addresses the main points naturally."""
+        
+        return system_prompt, enhanced_prompt
+    
+    async def _generate_draft(
+        self,
+        message: Message,
+        analysis: Dict,
+        retrieved_context: List[Dict],
+        tone: str
+    ) -> Optional[str]:
+        """Generate intelligent email draft using full context"""
+        try:
+            system_prompt, prompt = self._build_draft_prompts(
+                message, analysis, retrieved_context, tone
+            )
             
             # Generate draft
-            draft = self.llm.generate(
-                prompt=enhanced_prompt,
+            draft = await self.llm.agenerate(
+                prompt=prompt,
                 system_prompt=system_prompt,
                 temperature=0.7,
                 max_tokens=200
@@ -404,4 +562,39 @@ Write a {get_tone_description(tone)} response that addresses the main points nat
             
         except Exception as e:
             print(f"Draft generation error: {e}")
-            return None
\ No newline at end of file
+            return None
+    
+    async def stream_draft(self, db: Session, message: Message, tone: str) -> AsyncIterator[str]:
+        """Stream an email draft for a message as tokens arrive
+        
+        Pairs with get_suggestion(include_draft=False): the suggestion returns
+        without waiting on the draft, and the draft streams separately.
+        """
+        await self._connect_llm()
+        analysis = await self._analyze_message(message, message.embedding)
+        retrieved_context = await asyncio.to_thread(
+            self._retrieve_context, db, message, analysis
+        )
+        system_prompt, prompt = self._build_draft_prompts(
+            message, analysis, retrieved_context, tone
+        )
+        
+        async for chunk in self.llm.agenerate_stream(
+            prompt=prompt,
+            system_prompt=system_prompt,
+            temperature=0.7,
+            max_tokens=200
+        ):
+            yield chunk
+
+
+# Global instance
+_agent_engine = None
+
+
+def get_agent_engine() -> AgentEngine:
+    """Get or create agent engine singleton"""
+    global _agent_engine
+    if _agent_engine is None:
+        _agent_engine = AgentEngine()
+    return _agent_engine
@@ -0,0 +1,67 @@
+"""Initial schema, as Base.metadata.create_all built it before migrations
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-15 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("sender_name", sa.String(), nullable=False),
+        sa.Column("sender_type", sa.String(), nullable=False),
+        sa.Column("channel", sa.String(), nullable=False),
+        sa.Column("subject", sa.String()),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("timestamp", sa.DateTime()),
+        sa.Column("embedding", sa.JSON()),
+    )
+    op.create_table(
+        "decisions",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("message_id", sa.String(), sa.ForeignKey("messages.id"), nullable=False),
+        sa.Column("agent_suggestion", sa.JSON(), nullable=False),
+        sa.Column("human_action", sa.JSON(), nullable=False),
+        sa.Column("context_used", sa.JSON(), nullable=False),
+        sa.Column("why", sa.Text(), nullable=False),
+        sa.Column("timestamp", sa.DateTime()),
+    )
+    op.create_table(
+        "decision_precedents",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("decision_id", sa.String(), sa.ForeignKey("decisions.id"), nullable=False),
+        sa.Column("precedent_id", sa.String(), sa.ForeignKey("decisions.id"), nullable=False),
+    )
+    op.create_table(
+        "graph_nodes",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("node_type", sa.String(), nullable=False),
+        sa.Column("label", sa.String(), nullable=False),
+        sa.Column("properties", sa.JSON()),
+    )
+    op.create_table(
+        "graph_edges",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("source_id", sa.String(), nullable=False),
+        sa.Column("target_id", sa.String(), nullable=False),
+        sa.Column("edge_type", sa.String(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("graph_edges")
+    op.drop_table("graph_nodes")
+    op.drop_table("decision_precedents")
+    op.drop_table("decisions")
+    op.drop_table("messages")
@@ -0,0 +1,33 @@
+"""Indexes for timestamp ordering, decision joins and edge lookups
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-15 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_messages_timestamp", "messages", ["timestamp"])
+    op.create_index("ix_decisions_timestamp", "decisions", ["timestamp"])
+    op.create_index("ix_decisions_message_id", "decisions", ["message_id"])
+    op.create_index("ix_decision_precedents_decision_id", "decision_precedents", ["decision_id"])
+    op.create_index("ix_graph_edges_source_id_edge_type", "graph_edges", ["source_id", "edge_type"])
+    op.create_index("ix_graph_edges_target_id", "graph_edges", ["target_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_graph_edges_target_id", table_name="graph_edges")
+    op.drop_index("ix_graph_edges_source_id_edge_type", table_name="graph_edges")
+    op.drop_index("ix_decision_precedents_decision_id", table_name="decision_precedents")
+    op.drop_index("ix_decisions_message_id", table_name="decisions")
+    op.drop_index("ix_decisions_timestamp", table_name="decisions")
+    op.drop_index("ix_messages_timestamp", table_name="messages")
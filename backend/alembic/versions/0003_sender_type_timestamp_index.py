@@ -0,0 +1,25 @@
+"""Composite index for sender-type scoped, newest-first message scans
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-15 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_messages_sender_type_timestamp", "messages", ["sender_type", "timestamp"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_messages_sender_type_timestamp", table_name="messages")
@@ -0,0 +1,36 @@
+"""User profile table (defined before migrations, but never created)
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-15 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_profiles",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("formality_level", sa.Float()),
+        sa.Column("avg_response_length", sa.Float()),
+        sa.Column("emoji_usage", sa.Float()),
+        sa.Column("sender_preferences", sa.JSON()),
+        sa.Column("common_greetings", sa.JSON()),
+        sa.Column("common_signoffs", sa.JSON()),
+        sa.Column("tends_to_shorten", sa.Float()),
+        sa.Column("tends_to_casualize", sa.Float()),
+        sa.Column("total_decisions", sa.Float()),
+        sa.Column("total_overrides", sa.Float()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_profiles")
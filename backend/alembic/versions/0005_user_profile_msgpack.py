@@ -0,0 +1,85 @@
+"""Store user profile preference columns as msgpack instead of JSON
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-15 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+import msgpack
+import json
+
+
+# revision identifiers, used by Alembic.
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+COLUMNS = ("sender_preferences", "common_greetings", "common_signoffs")
+
+
+def _repack(to_binary: bool) -> None:
+    """Copy every column into its <name>_new twin, converting the encoding"""
+    conn = op.get_bind()
+    # SQLite has no JSON type: CAST(... AS JSON) would coerce to NUMERIC
+    cast_json = conn.dialect.name != "sqlite"
+    rows = conn.execute(
+        sa.text(f"SELECT id, {', '.join(COLUMNS)} FROM user_profiles")
+    ).mappings().all()
+    for row in rows:
+        values = {}
+        for column in COLUMNS:
+            value = row[column]
+            if to_binary:
+                # A raw SELECT skips the JSON type, so SQLite returns the text
+                if isinstance(value, str):
+                    value = json.loads(value)
+                values[column] = None if value is None else msgpack.packb(value, use_bin_type=True)
+            else:
+                values[column] = None if value is None else json.dumps(
+                    msgpack.unpackb(value, raw=False)
+                )
+        conn.execute(
+            sa.text(
+                "UPDATE user_profiles SET "
+                + ", ".join(
+                    f"{column}_new = :{column}" if to_binary or not cast_json
+                    else f"{column}_new = CAST(:{column} AS JSON)"
+                    for column in COLUMNS
+                )
+                + " WHERE id = :id"
+            ),
+            {"id": row["id"], **values}
+        )
+
+
+def _add_new_columns(column_type) -> None:
+    """Add a <name>_new column of the target type next to each column"""
+    with op.batch_alter_table("user_profiles") as batch_op:
+        for column in COLUMNS:
+            batch_op.add_column(sa.Column(f"{column}_new", column_type))
+
+
+def _replace_columns() -> None:
+    """Drop the old columns and move the converted ones into their place
+
+    Batch mode rebuilds the table on SQLite, which can't drop or rename
+    columns in place; other backends get plain ALTER statements.
+    """
+    with op.batch_alter_table("user_profiles") as batch_op:
+        for column in COLUMNS:
+            batch_op.drop_column(column)
+            batch_op.alter_column(f"{column}_new", new_column_name=column)
+
+
+def upgrade() -> None:
+    _add_new_columns(sa.LargeBinary())
+    _repack(to_binary=True)
+    _replace_columns()
+
+
+def downgrade() -> None:
+    _add_new_columns(sa.JSON())
+    _repack(to_binary=False)
+    _replace_columns()
@@ -0,0 +1,107 @@
+"""Store message embeddings as float32 bytes with an int8 copy
+
+Converts the JSON embedding array into L2-normalized float32 bytes and
+backfills embedding_q8 / embedding_q8_scale for every existing row.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-15 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+import numpy as np
+import json
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def _normalize(value) -> np.ndarray:
+    """Unit-length float32 vector (same as models.NormalizedVector on write)"""
+    vec = np.asarray(value, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+
+def _quantize(vec: np.ndarray):
+    """int8 vector and scale of a unit vector (same as models.quantize_int8)"""
+    max_abs = float(np.max(np.abs(vec))) if vec.size else 0.0
+    if max_abs == 0:
+        return np.zeros(vec.shape, dtype=np.int8), 0.0
+    q = np.clip(np.round(vec / max_abs * 127), -127, 127).astype(np.int8)
+    return q, max_abs / 127
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.add_column(sa.Column("embedding_new", sa.LargeBinary()))
+        batch_op.add_column(sa.Column("embedding_q8", sa.LargeBinary()))
+        batch_op.add_column(sa.Column("embedding_q8_scale", sa.Float()))
+
+    conn = op.get_bind()
+    rows = conn.execute(
+        sa.text("SELECT id, embedding FROM messages WHERE embedding IS NOT NULL")
+    ).all()
+    params = []
+    for message_id, value in rows:
+        # A raw SELECT skips the JSON type, so SQLite returns the text
+        if isinstance(value, str):
+            value = json.loads(value)
+        if value is None:
+            continue
+        vec = _normalize(value)
+        q, scale = _quantize(vec)
+        params.append({
+            "id": message_id,
+            "embedding": vec.tobytes(),
+            "q8": q.tobytes(),
+            "scale": scale,
+        })
+    if params:
+        conn.execute(
+            sa.text(
+                "UPDATE messages SET embedding_new = :embedding, "
+                "embedding_q8 = :q8, embedding_q8_scale = :scale WHERE id = :id"
+            ),
+            params
+        )
+
+    # Batch mode rebuilds the table on SQLite, which can't drop or rename
+    # columns in place
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.drop_column("embedding")
+        batch_op.alter_column("embedding_new", new_column_name="embedding")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.add_column(sa.Column("embedding_new", sa.JSON()))
+
+    conn = op.get_bind()
+    # SQLite has no JSON type: CAST(... AS JSON) would coerce to NUMERIC
+    target = ":embedding" if conn.dialect.name == "sqlite" else "CAST(:embedding AS JSON)"
+    rows = conn.execute(
+        sa.text("SELECT id, embedding FROM messages WHERE embedding IS NOT NULL")
+    ).all()
+    params = [
+        {
+            "id": message_id,
+            "embedding": json.dumps(np.frombuffer(value, dtype=np.float32).tolist()),
+        }
+        for message_id, value in rows
+    ]
+    if params:
+        conn.execute(
+            sa.text(f"UPDATE messages SET embedding_new = {target} WHERE id = :id"),
+            params
+        )
+
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.drop_column("embedding_q8_scale")
+        batch_op.drop_column("embedding_q8")
+        batch_op.drop_column("embedding")
+        batch_op.alter_column("embedding_new", new_column_name="embedding")
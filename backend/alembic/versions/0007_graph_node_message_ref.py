@@ -0,0 +1,47 @@
+"""Indexed message id column on graph nodes
+
+Backfilled from properties["message_id"] on existing message nodes.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-15 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+import json
+
+
+# revision identifiers, used by Alembic.
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("graph_nodes") as batch_op:
+        batch_op.add_column(sa.Column("message_ref_id", sa.String(), nullable=True))
+        batch_op.create_index("ix_graph_nodes_message_ref_id", ["message_ref_id"])
+
+    conn = op.get_bind()
+    rows = conn.execute(
+        sa.text("SELECT id, properties FROM graph_nodes WHERE node_type = 'message'")
+    ).all()
+    params = []
+    for node_id, properties in rows:
+        # A raw SELECT skips the JSON type, so SQLite returns the text
+        if isinstance(properties, str):
+            properties = json.loads(properties)
+        if properties and properties.get("message_id"):
+            params.append({"id": node_id, "message_id": properties["message_id"]})
+    if params:
+        conn.execute(
+            sa.text("UPDATE graph_nodes SET message_ref_id = :message_id WHERE id = :id"),
+            params
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("graph_nodes") as batch_op:
+        batch_op.drop_index("ix_graph_nodes_message_ref_id")
+        batch_op.drop_column("message_ref_id")
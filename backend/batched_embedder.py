@@ -0,0 +1,92 @@
+"""Micro-batching for embedding requests that arrive concurrently"""
+from typing import List, Optional, Tuple
+import asyncio
+
+import numpy as np
+
+from embeddings import get_cached_embeddings_batch
+
+
+class BatchedEmbedder:
+    """Collect embed() calls for a few milliseconds and encode them together
+
+    Concurrent requests share one batched model call (identical texts are
+    encoded once) instead of each paying for a batch-of-one forward pass.
+    """
+
+    def __init__(self, max_batch: int = 32, max_wait_ms: float = 10):
+        """Initialize embedder
+
+        Args:
+            max_batch: Maximum texts per model call
+            max_wait_ms: How long the first queued text waits for company
+        """
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self) -> None:
+        """Start the batching task on the running loop (once per loop)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embed one text, batched with any other pending requests
+
+        Returns:
+            Unit-normalized float32 embedding (384,)
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _next_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        """Wait for one request, then gather more until full or timed out"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                vectors = await asyncio.to_thread(
+                    get_cached_embeddings_batch, [text for text, _ in batch]
+                )
+            except Exception as e:
+                print(f"Batched embedding error: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+
+# Global instance
+_batched_embedder = None
+
+
+def get_batched_embedder() -> BatchedEmbedder:
+    """Get or create batched embedder singleton"""
+    global _batched_embedder
+    if _batched_embedder is None:
+        _batched_embedder = BatchedEmbedder()
+    return _batched_embedder
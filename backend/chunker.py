@@ -1,7 +1,29 @@
 """Message chunking for better retrieval"""
+from dataclasses import dataclass
 from typing import List, Dict
 import re
 
+_WORD_RE = re.compile(r"\S+")
+
+
+@dataclass(slots=True)
+class Chunk:
+    """One chunk of a message; chunks of a message share one metadata dict"""
+    text: str
+    chunk_id: str
+    chunk_index: int
+    total_chunks: int
+    message_metadata: Dict
+    
+    @property
+    def metadata(self) -> Dict:
+        """Flat metadata for the vector store"""
+        return {
+            **self.message_metadata,
+            "chunk_index": self.chunk_index,
+            "total_chunks": self.total_chunks
+        }
+
 
 class MessageChunker:
     """Chunk messages into semantic units for vector storage"""
@@ -16,14 +38,14 @@ class MessageChunker:
         self.chunk_size = chunk_size
         self.overlap = overlap
     
-    def chunk_message(self, message: Dict) -> List[Dict]:
+    def chunk_message(self, message: Dict) -> List[Chunk]:
         """Chunk a single message into smaller pieces
         
         Args:
             message: Dict with id, content, sender_name, sender_type, etc.
             
         Returns:
-            List of chunk dicts with text and metadata
+            List of chunks with text and metadata
         """
         # Combine subject and content
         subject = message.get("subject", "")
@@ -34,53 +56,36 @@ class MessageChunker:
             full_text += f"Subject: {subject}\n"
         full_text += f"Message: {content}"
         
-        # For short messages, return as single chunk
-        words = full_text.split()
-        if len(words) <= self.chunk_size:
-            return [{
-                "text": full_text,
-                "chunk_id": f"{message['id']}_0",
-                "metadata": {
-                    "message_id": message["id"],
-                    "sender_name": message["sender_name"],
-                    "sender_type": message["sender_type"],
-                    "channel": message.get("channel", "email"),
-                    "timestamp": str(message.get("timestamp", "")),
-                    "chunk_index": 0,
-                    "total_chunks": 1
-                }
-            }]
-        
-        # Split into overlapping chunks
-        chunks = []
-        chunk_index = 0
+        # Metadata common to every chunk of this message
+        message_metadata = {
+            "message_id": message["id"],
+            "sender_name": message["sender_name"],
+            "sender_type": message["sender_type"],
+            "channel": message.get("channel", "email"),
+            "timestamp": str(message.get("timestamp", ""))
+        }
         
-        for i in range(0, len(words), self.chunk_size - self.overlap):
-            chunk_words = words[i:i + self.chunk_size]
-            chunk_text = " ".join(chunk_words)
-            
-            chunks.append({
-                "text": chunk_text,
-                "chunk_id": f"{message['id']}_{chunk_index}",
-                "metadata": {
-                    "message_id": message["id"],
-                    "sender_name": message["sender_name"],
-                    "sender_type": message["sender_type"],
-                    "channel": message.get("channel", "email"),
-                    "timestamp": str(message.get("timestamp", "")),
-                    "chunk_index": chunk_index,
-                    "total_chunks": -1  # Updated below
-                }
-            })
-            chunk_index += 1
+        # Word spans in one C-level pass; windows slice the original string
+        spans = [m.span() for m in _WORD_RE.finditer(full_text)]
         
-        # Update total_chunks
-        for chunk in chunks:
-            chunk["metadata"]["total_chunks"] = len(chunks)
+        # For short messages, return as single chunk
+        if len(spans) <= self.chunk_size:
+            return [Chunk(full_text, f"{message['id']}_0", 0, 1, message_metadata)]
         
-        return chunks
+        # Split into overlapping chunks
+        starts = range(0, len(spans), self.chunk_size - self.overlap)
+        return [
+            Chunk(
+                text=full_text[spans[i][0]:spans[min(i + self.chunk_size, len(spans)) - 1][1]],
+                chunk_id=f"{message['id']}_{chunk_index}",
+                chunk_index=chunk_index,
+                total_chunks=len(starts),
+                message_metadata=message_metadata
+            )
+            for chunk_index, i in enumerate(starts)
+        ]
     
-    def chunk_conversation(self, messages: List[Dict]) -> List[Dict]:
+    def chunk_conversation(self, messages: List[Dict]) -> List[Chunk]:
         """Chunk multiple messages
         
         Args:
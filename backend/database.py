@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import get_settings
@@ -8,6 +10,40 @@ settings = get_settings()
 engine = create_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _async_url(url: str) -> str:
+    """Same database URL, routed through the backend's async driver"""
+    parsed = make_url(url)
+    driver = {
+        "postgresql": "postgresql+asyncpg",
+        "sqlite": "sqlite+aiosqlite",
+    }.get(parsed.get_backend_name(), parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+# Async engine for request handlers, so DB round-trips don't block the event loop.
+# Connections are pooled and reused across requests rather than opened per request.
+_is_sqlite = make_url(settings.database_url).get_backend_name() == "sqlite"
+async_engine = create_async_engine(
+    _async_url(settings.database_url),
+    **({} if _is_sqlite else {"pool_size": 10, "max_overflow": 20, "pool_pre_ping": True})
+)
+
+if _is_sqlite:
+    def _configure_sqlite(dbapi_connection, connection_record):
+        """Configure each pooled SQLite connection once, when it is opened"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA cache_size=-64000")
+        cursor.close()
+    
+    # The sync engine still serves some endpoints and init_db.py
+    for _engine in (engine, async_engine.sync_engine):
+        event.listen(_engine, "connect", _configure_sqlite)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -16,4 +52,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,102 @@
+"""Contiguous in-memory matrix of message embeddings (one row per message)"""
+from typing import Dict, List, Tuple
+import threading
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models import Message, LEGACY_INT8_SCALE
+
+EMBEDDING_DIM = 384
+
+
+class MessageEmbeddingMatrix:
+    """Struct-of-arrays store of int8 message embeddings and their scales
+
+    Rows are loaded from the database once per message and appended to one
+    contiguous int8 block, so a scan is a single gather + kernel call instead
+    of re-reading and re-stacking per-row blobs on every query. Message
+    embeddings never change after insert, so rows are never invalidated.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, capacity: int = 1024):
+        """Initialize matrix
+
+        Args:
+            dim: Embedding dimension
+            capacity: Initial number of rows to allocate
+        """
+        self.dim = dim
+        self.q8 = np.zeros((capacity, dim), dtype=np.int8)
+        self.scales = np.zeros(capacity, dtype=np.float32)
+        self.size = 0
+        self.row_of: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def rows(self, db: Session, message_ids: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Embeddings for the given messages, loading any not yet cached
+
+        Args:
+            db: Database session
+            message_ids: Message IDs, in the order rows are wanted
+
+        Returns:
+            Tuple of (int8 matrix (N, dim), float32 scales (N,)); messages
+            without an embedding get a zero row
+        """
+        missing = list({mid for mid in message_ids if mid not in self.row_of})
+        if missing:
+            self._load(db, missing)
+
+        index = np.fromiter(
+            (self.row_of.get(mid, -1) for mid in message_ids),
+            dtype=np.intp,
+            count=len(message_ids)
+        )
+        found = index >= 0
+        q8 = np.zeros((len(message_ids), self.dim), dtype=np.int8)
+        scales = np.zeros(len(message_ids), dtype=np.float32)
+        q8[found] = self.q8[index[found]]
+        scales[found] = self.scales[index[found]]
+        return q8, scales
+
+    def _load(self, db: Session, message_ids: List[str]) -> None:
+        """Append the stored int8 embeddings of the given messages"""
+        loaded = db.query(
+            Message.id, Message.embedding_q8, Message.embedding_q8_scale
+        ).filter(
+            Message.id.in_(message_ids),
+            Message.embedding_q8.isnot(None)
+        ).all()
+
+        with self._lock:
+            for message_id, q8, scale in loaded:
+                if message_id in self.row_of:
+                    continue
+                if self.size == len(self.q8):
+                    self._grow()
+                self.q8[self.size] = q8
+                self.scales[self.size] = LEGACY_INT8_SCALE if scale is None else scale
+                self.row_of[message_id] = self.size
+                self.size += 1
+
+    def _grow(self) -> None:
+        """Double the allocated rows"""
+        capacity = 2 * len(self.q8)
+        q8 = np.zeros((capacity, self.dim), dtype=np.int8)
+        scales = np.zeros(capacity, dtype=np.float32)
+        q8[:self.size] = self.q8[:self.size]
+        scales[:self.size] = self.scales[:self.size]
+        self.q8, self.scales = q8, scales
+
+
+# Global instance
+_message_embedding_matrix = None
+
+
+def get_message_embedding_matrix() -> MessageEmbeddingMatrix:
+    """Get or create message embedding matrix singleton"""
+    global _message_embedding_matrix
+    if _message_embedding_matrix is None:
+        _message_embedding_matrix = MessageEmbeddingMatrix()
+    return _message_embedding_matrix
@@ -1,15 +1,86 @@
 """Embedding service for semantic similarity"""
 from sentence_transformers import SentenceTransformer
 import numpy as np
+from cachetools import LRUCache, cached
 from functools import lru_cache
+from typing import Callable, Optional
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+
+from config import get_settings
+
+try:
+    import simsimd
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    SIMSIMD_AVAILABLE = False
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Int8-quantized ONNX export shipped in the model repo (AVX-512 VNNI kernels)
+ONNX_FILE_NAME = 'onnx/model_qint8_avx512_vnni.onnx'
+
+
+def _onnx_session_options():
+    """ONNX Runtime session with full graph fusion"""
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # 0 lets ORT size the intra-op pool to the physical core count
+    options.intra_op_num_threads = 0
+    return options
+
+
+# Load model once and bind it as a module global
+_MODEL = None
+_model_lock = threading.Lock()
+
 
-# Load model once and cache it
-@lru_cache(maxsize=1)
 def get_model():
-    """Load and cache the embedding model"""
+    """Get the embedding model, loading it on first use
+    
+    After the first load this is a plain global read (no cache lookup, no
+    lock). Loading is serialized so a background preload and an early
+    request never load the model twice.
+    """
+    global _MODEL
+    model = _MODEL
+    if model is None:
+        with _model_lock:
+            if _MODEL is None:
+                loaded = _load_model()
+                # Run one encode so kernels are initialized before traffic
+                loaded.encode("warmup", convert_to_numpy=True)
+                _MODEL = loaded
+            model = _MODEL
+    return model
+
+
+def _load_model():
+    """Load and cache the embedding model
+    
+    Prefers the int8 ONNX Runtime backend; falls back to PyTorch if
+    onnxruntime or the ONNX file is unavailable.
+    """
     print("Loading sentence-transformers model...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    print("Model loaded successfully!")
+    try:
+        model = SentenceTransformer(
+            MODEL_NAME,
+            backend='onnx',
+            model_kwargs={
+                'file_name': ONNX_FILE_NAME,
+                'provider': 'CPUExecutionProvider',
+                'session_options': _onnx_session_options()
+            }
+        )
+        print("Model loaded successfully (ONNX Runtime, int8)!")
+    except Exception as e:
+        print(f"ONNX backend unavailable ({e}), using PyTorch")
+        model = SentenceTransformer(MODEL_NAME)
+        print("Model loaded successfully!")
     return model
 
 
@@ -20,6 +91,7 @@ def get_embedding(text: str) -> list[float]:
     - Dimensions: 384
     - Fast inference (~0.01s per text)
     - Good for semantic search
+    - Unit-normalized, so cosine similarity is a plain dot product
     """
     if not text or not text.strip():
         # Return zero vector for empty text
@@ -27,7 +99,7 @@ def get_embedding(text: str) -> list[float]:
     
     try:
         model = get_model()
-        embedding = model.encode(text, convert_to_numpy=True)
+        embedding = model.encode(text, convert_to_numpy=True, normalize_embeddings=True)
         return embedding.tolist()
     except Exception as e:
         print(f"Embedding error: {e}")
@@ -35,17 +107,334 @@ def get_embedding(text: str) -> list[float]:
         return [0.0] * 384
 
 
-def cosine_similarity(a: list[float], b: list[float]) -> float:
-    """Calculate cosine similarity between two vectors"""
-    a_arr = np.array(a)
-    b_arr = np.array(b)
+# Cap concurrent encodes at the core count; extra threads only contend
+embedding_semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+
+
+async def aget_embedding(text: str) -> list[float]:
+    """get_embedding on a worker thread, so encoding never blocks the event loop"""
+    async with embedding_semaphore:
+        return await asyncio.to_thread(get_embedding, text)
+
+
+def preload_model() -> None:
+    """Start loading the model in the background to cut first-request latency"""
+    threading.Thread(target=get_model, name="embedding-preload", daemon=True).start()
+
+
+def get_embeddings_batch(texts: list[str], batch_size: int = 64) -> np.ndarray:
+    """Embed many texts in batched forward passes
+    
+    encode() already length-sorts inputs to limit padding and returns rows
+    in input order. Empty texts get zero vectors, as in get_embedding.
+    
+    Returns:
+        Unit-normalized float32 embeddings (len(texts), 384)
+    """
+    embeddings = np.zeros((len(texts), 384), dtype=np.float32)
+    indices = [i for i, text in enumerate(texts) if text and text.strip()]
+    if not indices:
+        return embeddings
+    
+    try:
+        model = get_model()
+        embeddings[indices] = model.encode(
+            [texts[i] for i in indices],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=len(indices) > batch_size
+        )
+    except Exception as e:
+        print(f"Embedding error: {e}")
+    return embeddings
+
+
+# Persistent embedding cache (SQLite), shared across processes and restarts
+_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _get_cache_connection() -> sqlite3.Connection:
+    """Open the on-disk embedding cache and make sure its table exists"""
+    conn = sqlite3.connect(get_settings().embedding_cache_path, check_same_thread=False)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS embedding_cache (
+            hash TEXT NOT NULL,
+            model TEXT NOT NULL,
+            vec BLOB NOT NULL,
+            PRIMARY KEY (hash, model)
+        )"""
+    )
+    
+    # One-shot migration: rows written before embeddings were normalized
+    if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+        rows = conn.execute("SELECT hash, model, vec FROM embedding_cache").fetchall()
+        conn.executemany(
+            "UPDATE embedding_cache SET vec = ? WHERE hash = ? AND model = ?",
+            [
+                (l2_normalize(np.frombuffer(vec, dtype=np.float32)).tobytes(), h, model)
+                for h, model, vec in rows
+            ]
+        )
+        conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    return conn
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 hex digest used as the embedding cache key"""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+@cached(
+    LRUCache(maxsize=4096),
+    key=lambda content_hash, text: content_hash,
+    lock=threading.Lock(),
+    info=True
+)
+def _cached_embed(content_hash: str, text: str) -> np.ndarray:
+    """Look up an embedding on disk, computing and persisting it on a miss
+
+    The in-process LRU sits in front of the SQLite table, so repeated
+    content never reaches the model or the disk twice. It is keyed on the
+    digest alone; text is only read on a miss and is not kept alive by the
+    cache. Entries are read-only float32 arrays (1.5 KB each, vs ~12 KB as
+    Python floats).
+    """
+    try:
+        with _cache_lock:
+            conn = _get_cache_connection()
+            row = conn.execute(
+                "SELECT vec FROM embedding_cache WHERE hash = ? AND model = ?",
+                (content_hash, MODEL_NAME)
+            ).fetchone()
+        if row:
+            return np.frombuffer(row[0], dtype=np.float32)
+    except sqlite3.Error as e:
+        print(f"Embedding cache read error: {e}")
+
+    embedding = np.asarray(get_embedding(text), dtype=np.float32)
+    if not embedding.any():
+        # Model failed; don't pin the zero vector in either cache layer
+        raise ValueError("embedding model unavailable")
+    embedding.flags.writeable = False
+
+    try:
+        with _cache_lock:
+            conn = _get_cache_connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO embedding_cache (hash, model, vec) VALUES (?, ?, ?)",
+                (content_hash, MODEL_NAME, embedding.tobytes())
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"Embedding cache write error: {e}")
+
+    return embedding
+
+
+def get_cached_embedding_array(text: str) -> np.ndarray:
+    """Get embedding for text as a read-only float32 array, reusing cached vectors
+
+    Preferred on scoring paths: no list round-trip, no float64 widening.
+    """
+    if not text or not text.strip():
+        return np.zeros(384, dtype=np.float32)
+    try:
+        return _cached_embed(content_hash(text), text)
+    except ValueError:
+        return np.zeros(384, dtype=np.float32)
+
+
+async def aget_cached_embedding_array(text: str) -> np.ndarray:
+    """get_cached_embedding_array off the event loop (cache misses run the model)"""
+    async with embedding_semaphore:
+        return await asyncio.to_thread(get_cached_embedding_array, text)
+
+
+def get_cached_embeddings_batch(texts: list[str], batch_size: int = 64) -> np.ndarray:
+    """Batch counterpart of get_cached_embedding
+    
+    Identical texts (e.g. a short message and its single chunk) are
+    encoded once, and texts seen in earlier runs are read from disk, so
+    re-indexing only runs the model on new content.
     
-    dot_product = np.dot(a_arr, b_arr)
-    norm_a = np.linalg.norm(a_arr)
-    norm_b = np.linalg.norm(b_arr)
+    Returns:
+        Unit-normalized float32 embeddings (len(texts), 384)
+    """
+    hashes = [content_hash(text) if text and text.strip() else None for text in texts]
+    unique = {h: text for h, text in zip(hashes, texts) if h is not None}
+    found = {}
+    
+    try:
+        with _cache_lock:
+            conn = _get_cache_connection()
+            keys = list(unique)
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT hash, vec FROM embedding_cache WHERE model = ? "
+                    f"AND hash IN ({','.join('?' * len(part))})",
+                    (MODEL_NAME, *part)
+                ).fetchall()
+                found.update((h, np.frombuffer(vec, dtype=np.float32)) for h, vec in rows)
+    except sqlite3.Error as e:
+        print(f"Embedding cache read error: {e}")
+    
+    missing = [h for h in unique if h not in found]
+    if missing:
+        computed = get_embeddings_batch([unique[h] for h in missing], batch_size)
+        fresh = [(h, vec) for h, vec in zip(missing, computed) if vec.any()]
+        found.update(fresh)
+        try:
+            with _cache_lock:
+                conn = _get_cache_connection()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embedding_cache (hash, model, vec) VALUES (?, ?, ?)",
+                    [(h, MODEL_NAME, vec.tobytes()) for h, vec in fresh]
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Embedding cache write error: {e}")
+    
+    embeddings = np.zeros((len(texts), 384), dtype=np.float32)
+    for i, h in enumerate(hashes):
+        if h in found:
+            embeddings[i] = found[h]
+    return embeddings
+
+
+def embedding_cache_stats() -> dict:
+    """Hit/miss counters for the in-process embedding cache"""
+    info = _cached_embed.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+        "size": info.currsize,
+        "max_size": info.maxsize
+    }
+
+
+def get_cached_embedding(text: str) -> list[float]:
+    """Get embedding for text, reusing previously computed vectors
+
+    Same contract as get_embedding, but identical content (signatures,
+    templated blasts, repeated queries) short-circuits the model call.
+    """
+    return get_cached_embedding_array(text).tolist()
+
+
+def cosine_similarity(a: list[float] | np.ndarray, b: list[float] | np.ndarray) -> float:
+    """Calculate cosine similarity between two vectors
     
-    if norm_a == 0 or norm_b == 0:
+    ndarray inputs are used without copying.
+    """
+    a_arr = np.asarray(a, dtype=np.float32)
+    b_arr = np.asarray(b, dtype=np.float32)
+    
+    if SIMSIMD_AVAILABLE:
+        # SIMD kernel returns cosine distance (1.0 when either side is zero)
+        return float(1.0 - simsimd.cosine(a_arr, b_arr))
+    
+    denom = np.vdot(a_arr, a_arr) * np.vdot(b_arr, b_arr)
+    if denom == 0:
         return 0.0
     
-    return float(dot_product / (norm_a * norm_b))
+    return float(np.dot(a_arr, b_arr) / np.sqrt(denom))
+
+
+
+def cosine_similarity_normalized(a: np.ndarray, b: np.ndarray) -> float:
+    """Cosine similarity of two unit-length vectors (a plain dot product)"""
+    return float(np.dot(a, b))
+
+
+def l2_normalize(vec) -> np.ndarray:
+    """Return vec as unit-length float32 (zero vectors are returned as-is)"""
+    arr = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(arr)
+    return arr / norm if norm > 0 else arr
+
+
+def cosine_similarity_matrix(query, corpus) -> np.ndarray:
+    """Cosine similarity of one query vector against every row of a matrix
+    
+    Args:
+        query: Query vector (d,)
+        corpus: Candidate vectors (N, d)
+        
+    Returns:
+        Scores (N,); rows or queries with zero norm score 0
+    """
+    q = np.asarray(query, dtype=np.float32)
+    m = np.asarray(corpus, dtype=np.float32)
+    if m.size == 0:
+        return np.zeros(len(m), dtype=np.float32)
+    
+    if SIMSIMD_AVAILABLE:
+        distances = simsimd.cdist(q.reshape(1, -1), m, metric="cosine")
+        return 1.0 - np.asarray(distances, dtype=np.float32)[0]
+    
+    denom = np.linalg.norm(m, axis=1) * np.linalg.norm(q)
+    scores = m @ q
+    return np.divide(scores, denom, out=np.zeros_like(scores), where=denom > 0)
+
 
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first (O(N) selection)"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def mmr_indices(
+    scores: np.ndarray,
+    matrix: Optional[np.ndarray],
+    k: int,
+    lambda_: float = 0.7,
+    similarity: Optional[Callable[[int], np.ndarray]] = None
+) -> np.ndarray:
+    """Maximal marginal relevance selection over a candidate matrix
+    
+    Each pick maximizes lambda * relevance - (1 - lambda) * (highest similarity
+    to anything already picked). Similarities to the picked set are kept as a
+    running max, so each step is one matrix-vector product plus masked argmax.
+    
+    Args:
+        scores: Relevance of each candidate to the query (N,)
+        matrix: Unit-normalized candidate embeddings (N, d); unused when
+            similarity is given
+        k: Number of candidates to select
+        lambda_: Relevance/diversity trade-off (1.0 = plain top-k)
+        similarity: Similarities of every candidate to candidate i (N,),
+            for candidates not held as a float matrix (e.g. int8 rows)
+        
+    Returns:
+        Selected indices, in pick order
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.intp)
+    
+    if similarity is None:
+        similarity = lambda i: matrix @ matrix[i]
+    
+    scores = np.asarray(scores, dtype=np.float32)
+    selected = np.zeros(len(scores), dtype=bool)
+    picks = [int(np.argmax(scores))]
+    selected[picks[0]] = True
+    max_sim = similarity(picks[0])
+    
+    for _ in range(k - 1):
+        mmr = lambda_ * scores - (1 - lambda_) * max_sim
+        mmr[selected] = -np.inf
+        best = int(np.argmax(mmr))
+        picks.append(best)
+        selected[best] = True
+        np.maximum(max_sim, similarity(best), out=max_sim)
+    
+    return np.array(picks, dtype=np.intp)
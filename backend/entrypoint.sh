@@ -0,0 +1,22 @@
+#!/bin/sh
+# Bring the schema up to date once, then hand off to the container command
+set -e
+
+# Databases built by create_all before migrations have the tables of
+# revision 0001 but no alembic_version; record them as 0001 so the later
+# revisions convert them instead of recreating the tables
+if python - <<'EOF'
+import sys
+from sqlalchemy import create_engine, inspect
+from config import get_settings
+
+tables = inspect(create_engine(get_settings().database_url)).get_table_names()
+sys.exit(0 if "messages" in tables and "alembic_version" not in tables else 1)
+EOF
+then
+    alembic stamp 0001
+fi
+
+alembic upgrade head
+
+exec "$@"
@@ -1,15 +1,35 @@
 """Initialize database with mock messages"""
-from database import SessionLocal, engine
-from models import Base, Message
+from database import SessionLocal
+from models import Message, quantize_int8
 from mock_data import MOCK_MESSAGES
-from embeddings import get_embedding
+from embeddings import get_cached_embeddings_batch, preload_model
 from vector_store import get_vector_store
 from chunker import get_chunker
 from keyword_search import get_keyword_searcher
 import uuid
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
+# Tables are created by migrations: run `alembic upgrade head` first
+
+def backfill_quantized_embeddings():
+    """Re-quantize stored embeddings that lack an int8 copy or its scale
+    
+    Rows written before embedding_q8 (or its per-vector scale) existed
+    keep NULLs there, which drops them from the int8 precedent scan.
+    """
+    db = SessionLocal()
+    try:
+        stale = db.query(Message).filter(
+            Message.embedding.isnot(None),
+            (Message.embedding_q8.is_(None)) | (Message.embedding_q8_scale.is_(None))
+        ).all()
+        for message in stale:
+            message.embedding_q8, message.embedding_q8_scale = quantize_int8(message.embedding)
+        db.commit()
+        if stale:
+            print(f"✅ Re-quantized {len(stale)} message embeddings")
+    finally:
+        db.close()
+
 
 def init_messages():
     """Load mock messages into database and vector store"""
@@ -24,6 +44,9 @@ def init_messages():
     
     print("Initializing database with mock messages...")
     
+    # Load the model while the stores open and messages are built
+    preload_model()
+    
     # Get services
     vector_store = get_vector_store()
     chunker = get_chunker()
@@ -31,10 +54,10 @@ def init_messages():
     messages = []
     all_chunks = []
     
-    for msg_data in MOCK_MESSAGES:
-        # Generate embedding for semantic search
-        embedding = get_embedding(msg_data["content"])
-        
+    # Generate embeddings for semantic search in one batched pass
+    embeddings = get_cached_embeddings_batch([m["content"] for m in MOCK_MESSAGES])
+    
+    for msg_data, embedding in zip(MOCK_MESSAGES, embeddings):
         message = Message(
             id=str(uuid.uuid4()),
             sender_name=msg_data["sender_name"],
@@ -65,16 +88,13 @@ def init_messages():
     
     # Add to vector store
     print("Adding chunks to vector store...")
-    for chunk in all_chunks:
-        chunk_embedding = get_embedding(chunk["text"])
-        vector_store.store(
-            id=chunk["chunk_id"],
-            text=chunk["text"],
-            embedding=chunk_embedding,
-            metadata=chunk["metadata"]
-        )
-    
-    print(f"✅ Added {len(all_chunks)} chunks to ChromaDB")
+    # The collection embeds chunk texts itself, in batches, on the store's
+    # writer thread while the keyword index is built below
+    vector_store_write = vector_store.store_batch(
+        ids=[c.chunk_id for c in all_chunks],
+        texts=[c.text for c in all_chunks],
+        metadatas=[c.metadata for c in all_chunks]
+    )
     
     # Index for keyword search
     print("Building keyword search index...")
@@ -91,10 +111,14 @@ def init_messages():
     keyword_searcher.index_messages(msg_dicts)
     print(f"✅ Indexed {len(messages)} messages for keyword search")
     
+    vector_store_write.result()
+    print(f"✅ Added {len(all_chunks)} chunks to ChromaDB")
+    
     db.close()
     print(f"\n🎉 Initialization complete! Ready to use.")
 
 
 if __name__ == "__main__":
+    backfill_quantized_embeddings()
     init_messages()
 
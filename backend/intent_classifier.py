@@ -0,0 +1,179 @@
+"""Embedding-based message analysis, used before falling back to the LLM"""
+from collections import Counter
+from typing import Dict, List, Optional
+import os
+import pickle
+
+import numpy as np
+
+from config import get_settings
+
+# Single-label fields predicted from the message embedding; topics get a
+# multi-label head of their own
+HEADS = ("intent", "urgency", "requires_action")
+
+# Below this class probability on any head, defer to the LLM
+MIN_CONFIDENCE = 0.7
+
+# Topics the LLM used fewer times than this are too rare to learn
+MIN_TOPIC_COUNT = 3
+
+# A topic is predicted at or above this probability, at most MAX_TOPICS of them
+TOPIC_THRESHOLD = 0.5
+MAX_TOPICS = 3
+
+
+class IntentClassifier:
+    """Logistic-regression heads per analysis field, over message embeddings"""
+
+    def __init__(self, heads: Dict):
+        self.heads = heads
+
+    @classmethod
+    def fit(cls, embeddings: List, analyses: List[Dict]) -> "IntentClassifier":
+        """Train heads on historical (embedding, analysis) pairs
+
+        Args:
+            embeddings: Message embeddings (N, d)
+            analyses: Matching analysis dicts as produced by the LLM
+
+        Raises:
+            ValueError: If a head has fewer than two distinct labels, or fewer
+                than two topics occur at least MIN_TOPIC_COUNT times
+        """
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.multiclass import OneVsRestClassifier
+        from sklearn.preprocessing import MultiLabelBinarizer
+
+        X = np.asarray(embeddings, dtype=np.float32)
+        heads = {}
+        for head in HEADS:
+            y = [str(analysis.get(head)) for analysis in analyses]
+            if len(set(y)) < 2:
+                raise ValueError(f"Need at least two '{head}' labels to train")
+            clf = LogisticRegression(max_iter=1000)
+            clf.fit(X, y)
+            heads[head] = clf
+
+        # One binary classifier per topic the LLM used often enough
+        topic_lists = [
+            {str(t).strip().lower() for t in analysis.get("topics") or []}
+            for analysis in analyses
+        ]
+        counts = Counter(t for topics in topic_lists for t in topics)
+        vocabulary = sorted(t for t, count in counts.items() if count >= MIN_TOPIC_COUNT)
+        if len(vocabulary) < 2:
+            raise ValueError(f"Need two topics seen at least {MIN_TOPIC_COUNT} times to train")
+        binarizer = MultiLabelBinarizer(classes=vocabulary)
+        y = binarizer.fit_transform([topics & set(vocabulary) for topics in topic_lists])
+        clf = OneVsRestClassifier(LogisticRegression(max_iter=1000))
+        clf.fit(X, y)
+        heads["topics"] = (binarizer, clf)
+        return cls(heads)
+
+    def predict(self, embedding, min_confidence: float = MIN_CONFIDENCE) -> Optional[Dict]:
+        """Predict an analysis dict, or None if any head is unsure
+
+        Args:
+            embedding: Message embedding (d,)
+            min_confidence: Minimum top-class probability per head
+
+        Returns:
+            Analysis dict, or None if a head is unsure, no topic clears
+            TOPIC_THRESHOLD, or the heads predate the topics head
+        """
+        if "topics" not in self.heads:
+            return None
+
+        x = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        labels = {}
+        for head in HEADS:
+            clf = self.heads[head]
+            proba = clf.predict_proba(x)[0]
+            best = int(np.argmax(proba))
+            if proba[best] < min_confidence:
+                return None
+            labels[head] = clf.classes_[best]
+
+        binarizer, clf = self.heads["topics"]
+        topic_proba = clf.predict_proba(x)[0]
+        topics = [
+            binarizer.classes_[i]
+            for i in np.argsort(topic_proba)[::-1][:MAX_TOPICS]
+            if topic_proba[i] >= TOPIC_THRESHOLD
+        ]
+        if not topics:
+            return None
+
+        return {
+            "intent": labels["intent"],
+            "topics": [str(t) for t in topics],
+            "urgency": labels["urgency"],
+            "requires_action": labels["requires_action"] == "True",
+            "action_description": None
+        }
+
+    def save(self, path: str) -> None:
+        """Pickle the trained heads to disk"""
+        with open(path, "wb") as f:
+            pickle.dump(self.heads, f)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        """Load heads pickled by save()"""
+        with open(path, "rb") as f:
+            return cls(pickle.load(f))
+
+
+# Global instance
+_intent_classifier = None
+_intent_classifier_loaded = False
+
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """Get the trained classifier, or None if none has been trained yet"""
+    global _intent_classifier, _intent_classifier_loaded
+    if not _intent_classifier_loaded:
+        _intent_classifier_loaded = True
+        path = get_settings().intent_classifier_path
+        if os.path.exists(path):
+            try:
+                _intent_classifier = IntentClassifier.load(path)
+            except Exception as e:
+                print(f"Intent classifier load error: {e}")
+    return _intent_classifier
+
+
+if __name__ == "__main__":
+    # Label every stored message with the LLM analysis, then train and save
+    import asyncio
+    from database import SessionLocal
+    from models import Message
+    from agent import get_agent_engine
+
+    db = SessionLocal()
+    try:
+        agent = get_agent_engine()
+        messages = db.query(Message).filter(Message.embedding.isnot(None)).all()
+        
+        async def label_all(concurrency: int = 4):
+            semaphore = asyncio.Semaphore(concurrency)
+            
+            async def label(message):
+                async with semaphore:
+                    return await agent.analyze_with_llm(message)
+            
+            return await asyncio.gather(*(label(message) for message in messages))
+        
+        analyses = asyncio.run(label_all())
+        pairs = [
+            (message.embedding, analysis)
+            for message, analysis in zip(messages, analyses)
+            if analysis is not None
+        ]
+        classifier = IntentClassifier.fit([e for e, _ in pairs], [a for _, a in pairs])
+        path = get_settings().intent_classifier_path
+        classifier.save(path)
+        print(f"✅ Trained intent classifier on {len(pairs)} messages -> {path}")
+    finally:
+        db.close()
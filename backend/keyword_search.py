@@ -1,7 +1,28 @@
 """BM25 keyword search for exact term matching"""
-from rank_bm25 import BM25Okapi
+import bm25s
 from typing import List, Dict, Tuple
-import re
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+
+
+class _PunctuationTable(dict):
+    """str.translate table mapping punctuation (except - @ .) to spaces
+    
+    Same character classes as re.sub(r'[^\w\s\-@.]', ' ', ...); entries for
+    non-ASCII code points are filled in on first sight.
+    """
+    
+    def __missing__(self, code: int):
+        char = chr(code)
+        keep = char.isalnum() or char == "_" or char.isspace() or char in "-@."
+        self[code] = code if keep else " "
+        return self[code]
+
+
+_PUNCTUATION_TABLE = _PunctuationTable()
+for _code in range(128):
+    _PUNCTUATION_TABLE[_code]
 
 
 class KeywordSearcher:
@@ -13,6 +34,8 @@ class KeywordSearcher:
         self.corpus = []
         self.metadata = []
         self.tokenized_corpus = []
+        self.doc_freqs = {}
+        self.sender_types = np.array([], dtype=object)
     
     def index_messages(self, messages: List[Dict]) -> None:
         """Index messages for keyword search
@@ -47,9 +70,16 @@ class KeywordSearcher:
             tokens = self._tokenize(text)
             self.tokenized_corpus.append(tokens)
         
-        # Build BM25 index
+        # Build BM25 index (sparse precomputed term scores)
         if self.tokenized_corpus:
-            self.bm25 = BM25Okapi(self.tokenized_corpus)
+            self.bm25 = bm25s.BM25()
+            self.bm25.index(self.tokenized_corpus, show_progress=False)
+            self.doc_freqs = Counter(
+                term for tokens in self.tokenized_corpus for term in set(tokens)
+            )
+            self.sender_types = np.array(
+                [meta["sender_type"] for meta in self.metadata], dtype=object
+            )
             print(f"BM25 index built: {len(self.corpus)} documents")
     
     def search(
@@ -72,32 +102,43 @@ class KeywordSearcher:
             return []
         
         # Tokenize query
-        tokenized_query = self._tokenize(query)
+        tokenized_query = list(self._tokenize_query(query))
+        
+        # bm25s indexes the first query token unconditionally; a query with
+        # no terms (punctuation, stopword-only, emoji) matches nothing
+        if not tokenized_query:
+            return []
         
         # Get BM25 scores
         scores = self.bm25.get_scores(tokenized_query)
         
-        # Create results list
-        results = []
-        for i, score in enumerate(scores):
-            if score > 0:  # Only include matches
-                meta = self.metadata[i]
-                
-                # Apply filter if specified
-                if filter_sender_type and meta.get("sender_type") != filter_sender_type:
-                    continue
-                
-                results.append((
-                    meta["id"],
-                    float(score),
-                    meta
-                ))
-        
-        # Sort by score and return top-k
-        results.sort(key=lambda x: x[1], reverse=True)
-        return results[:top_k]
+        scores = np.asarray(scores, dtype=np.float64)
+        
+        # Apply filter if specified
+        if filter_sender_type:
+            scores = np.where(self.sender_types == filter_sender_type, scores, 0.0)
+        
+        # Select top-k in O(N), then order just those
+        if top_k < len(scores):
+            top = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        
+        return [
+            (self.metadata[i]["id"], float(scores[i]), self.metadata[i])
+            for i in top
+            if scores[i] > 0  # Only include matches
+        ]
     
-    def _tokenize(self, text: str) -> List[str]:
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def _tokenize_query(query: str) -> Tuple[str, ...]:
+        """Tokenize a query, memoized (the same queries recur across retrievals)"""
+        return tuple(KeywordSearcher._tokenize(query))
+    
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
         """Tokenize text for BM25
         
         Args:
@@ -110,7 +151,7 @@ class KeywordSearcher:
         text = text.lower()
         
         # Remove punctuation except for important ones
-        text = re.sub(r'[^\w\s\-@.]', ' ', text)
+        text = text.translate(_PUNCTUATION_TABLE)
         
         # Split into words
         tokens = text.split()
@@ -129,14 +170,8 @@ class KeywordSearcher:
         Returns:
             Dict mapping terms to document frequencies
         """
-        tokens = self._tokenize(query)
-        term_freqs = {}
-        
-        for term in tokens:
-            count = sum(1 for doc in self.tokenized_corpus if term in doc)
-            term_freqs[term] = count
-        
-        return term_freqs
+        tokens = self._tokenize_query(query)
+        return {term: self.doc_freqs.get(term, 0) for term in tokens}
 
 
 # Global instance
@@ -1,7 +1,13 @@
 """Local LLM integration using Ollama"""
 import ollama
+import asyncio
+import json
 import os
-from typing import Optional, List, Dict
+import weakref
+from typing import Optional, List, Dict, AsyncIterator, Iterator
+
+# Keep the model resident between requests (Ollama unloads after 5m idle)
+KEEP_ALIVE = "30m"
 
 
 class LLMClient:
@@ -19,25 +25,40 @@ class LLMClient:
         if host is None:
             host = os.getenv("OLLAMA_HOST", "http://host.docker.internal:11434")
         self.host = host
+        # One connection pool for the process; async clients are per event loop
+        self.client = ollama.Client(host=self.host)
+        self._async_clients = weakref.WeakKeyDictionary()
         self._check_connection()
     
     def _check_connection(self):
-        """Check if Ollama is running"""
+        """Check if Ollama is running and load the model before traffic arrives"""
         try:
-            # Set the host for ollama client
-            ollama.Client(host=self.host).list()
+            self.client.list()
             print(f"✅ Connected to Ollama at {self.host} (model: {self.model})")
+            # An empty prompt just loads the model into memory
+            self.client.generate(model=self.model, prompt='', keep_alive=KEEP_ALIVE)
         except Exception as e:
             print(f"⚠️  Ollama not available at {self.host}: {e}")
             print("   Install: curl -fsSL https://ollama.com/install.sh | sh")
             print(f"   Then run: ollama pull {self.model}")
     
+    @property
+    def async_client(self) -> ollama.AsyncClient:
+        """AsyncClient bound to the running event loop, reused across calls"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = ollama.AsyncClient(host=self.host)
+            self._async_clients[loop] = client
+        return client
+    
     def generate(
         self,
         prompt: str,
         system_prompt: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: int = 500
+        max_tokens: int = 500,
+        json_mode: bool = False
     ) -> str:
         """Generate text from prompt
         
@@ -46,10 +67,35 @@ class LLMClient:
             system_prompt: Optional system instructions
             temperature: Sampling temperature (0-1)
             max_tokens: Maximum response length
+            json_mode: Constrain output to a JSON object (Ollama format=json)
             
         Returns:
             Generated text
         """
+        return "".join(self.generate_stream(
+            prompt, system_prompt, temperature, max_tokens, json_mode
+        ))
+    
+    def generate_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        """Generate text from prompt, yielding chunks as the model emits them
+        
+        Args:
+            prompt: User prompt
+            system_prompt: Optional system instructions
+            temperature: Sampling temperature (0-1)
+            max_tokens: Maximum response length
+            json_mode: Constrain output to a JSON object (Ollama format=json)
+            
+        Yields:
+            Text chunks (the fallback response if nothing was generated)
+        """
         messages = []
         
         if system_prompt:
@@ -63,11 +109,68 @@ class LLMClient:
             'content': prompt
         })
         
+        started = False
         try:
-            client = ollama.Client(host=self.host)
-            response = client.chat(
+            stream = self.client.chat(
                 model=self.model,
+                keep_alive=KEEP_ALIVE,
                 messages=messages,
+                stream=True,
+                format='json' if json_mode else '',
+                options={
+                    'temperature': temperature,
+                    'num_predict': max_tokens
+                }
+            )
+            
+            for chunk in stream:
+                started = True
+                yield chunk['message']['content']
+            
+        except Exception as e:
+            print(f"LLM generation error: {e}")
+            if not started:
+                yield self._fallback_response()
+    
+    async def agenerate(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        json_mode: bool = False
+    ) -> str:
+        """Async variant of generate, so independent calls can overlap
+        
+        Args:
+            prompt: User prompt
+            system_prompt: Optional system instructions
+            temperature: Sampling temperature (0-1)
+            max_tokens: Maximum response length
+            json_mode: Constrain output to a JSON object (Ollama format=json)
+            
+        Returns:
+            Generated text
+        """
+        messages = []
+        
+        if system_prompt:
+            messages.append({
+                'role': 'system',
+                'content': system_prompt
+            })
+        
+        messages.append({
+            'role': 'user',
+            'content': prompt
+        })
+        
+        try:
+            response = await self.async_client.chat(
+                model=self.model,
+                keep_alive=KEEP_ALIVE,
+                messages=messages,
+                format='json' if json_mode else '',
                 options={
                     'temperature': temperature,
                     'num_predict': max_tokens
@@ -80,6 +183,89 @@ class LLMClient:
             print(f"LLM generation error: {e}")
             return self._fallback_response()
     
+    async def agenerate_many(
+        self,
+        prompts: List[str],
+        concurrency: int = 4,
+        **kwargs
+    ) -> List[str]:
+        """Run agenerate over many prompts with bounded concurrency
+        
+        Args:
+            prompts: User prompts
+            concurrency: Maximum requests in flight at once
+            **kwargs: Passed through to agenerate
+            
+        Returns:
+            Generated texts, in prompt order
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def run(prompt: str) -> str:
+            async with semaphore:
+                return await self.agenerate(prompt, **kwargs)
+        
+        return await asyncio.gather(*(run(prompt) for prompt in prompts))
+    
+    def generate_batch(
+        self,
+        prompts: List[str],
+        concurrency: int = 4,
+        **kwargs
+    ) -> List[str]:
+        """Sync wrapper around agenerate_many for scripts and batch jobs"""
+        return asyncio.run(self.agenerate_many(prompts, concurrency, **kwargs))
+    
+    async def agenerate_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 500
+    ) -> AsyncIterator[str]:
+        """Stream generated text chunk by chunk as the model emits it
+        
+        Args:
+            prompt: User prompt
+            system_prompt: Optional system instructions
+            temperature: Sampling temperature (0-1)
+            max_tokens: Maximum response length
+            
+        Yields:
+            Text chunks
+        """
+        messages = []
+        
+        if system_prompt:
+            messages.append({
+                'role': 'system',
+                'content': system_prompt
+            })
+        
+        messages.append({
+            'role': 'user',
+            'content': prompt
+        })
+        
+        try:
+            stream = await self.async_client.chat(
+                model=self.model,
+                keep_alive=KEEP_ALIVE,
+                messages=messages,
+                stream=True,
+                options={
+                    'temperature': temperature,
+                    'num_predict': max_tokens
+                }
+            )
+            
+            async for chunk in stream:
+                yield chunk['message']['content']
+            
+        except Exception as e:
+            print(f"LLM streaming error: {e}")
+            yield self._fallback_response()
+    
     def generate_email_draft(
         self,
         context: str,
@@ -137,28 +323,31 @@ Generate a brief, appropriate email reply:"""
         """
         prompt = f"""Analyze this message and extract:
 1. Primary intent (question, request, update, urgent_request, casual_check_in)
-2. Key topics (comma-separated)
+2. Key topics
 3. Urgency level (low, medium, high)
 
 Message:
 {message_content}
 
-Return in format:
-Intent: [intent]
-Topics: [topics]
-Urgency: [level]"""
+Respond with a JSON object:
+{{"intent": "<intent>", "topics": ["<topic>", ...], "urgency": "<level>"}}"""
         
         try:
-            response = self.generate(prompt, max_tokens=100)
+            response = self.generate(
+                prompt, temperature=0.0, max_tokens=80, json_mode=True
+            )
             
-            # Parse response
-            intent_data = {}
-            for line in response.split('\n'):
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    intent_data[key.strip().lower()] = value.strip()
+            # JSON mode guarantees an object; keep the flat string contract
+            parsed = json.loads(response)
+            topics = parsed.get("topics") or ["general"]
+            if isinstance(topics, list):
+                topics = ", ".join(str(t) for t in topics)
             
-            return intent_data
+            return {
+                "intent": str(parsed.get("intent", "unknown")),
+                "topics": str(topics),
+                "urgency": str(parsed.get("urgency", "medium")).lower()
+            }
             
         except Exception:
             return {
@@ -186,9 +375,9 @@ Urgency: [level]"""
             Assistant response
         """
         try:
-            client = ollama.Client(host=self.host)
-            response = client.chat(
+            response = self.client.chat(
                 model=self.model,
+                keep_alive=KEEP_ALIVE,
                 messages=messages,
                 options={'temperature': temperature}
             )
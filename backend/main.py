@@ -1,29 +1,59 @@
 """Main FastAPI application"""
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, raiseload
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Literal
+import asyncio
+import orjson
 import uuid
 
-from database import get_db, engine
-from models import Base, Message, Decision, DecisionPrecedent, GraphNode, GraphEdge
+from database import get_db, get_async_db, async_engine, AsyncSessionLocal, SessionLocal
+from models import Message, Decision, DecisionPrecedent, GraphNode, GraphEdge
 from schemas import (
     Message as MessageSchema,
     DecisionTraceCreate,
     DecisionTrace,
+    DecisionBatchError,
+    DecisionBatchResponse,
     AgentResponse,
     GraphResponse,
-    GraphNodeResponse,
-    GraphEdgeResponse,
 )
-from agent import AgentEngine
-from embeddings import get_embedding
+from agent import get_agent_engine
+from retriever import get_hybrid_retriever
+from embeddings import embedding_cache_stats, preload_model
+from batched_embedder import get_batched_embedder
 from vector_store import get_vector_store
+from semantic_cache import get_suggestion_cache
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Attempts for a background vector-store write before giving up
+VECTOR_STORE_ATTEMPTS = 3
+
+# Rows fetched (and encoded) per chunk when streaming the graph
+GRAPH_STREAM_BATCH = 1000
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the embedding model and backfill missing decision vectors in the
+    background; release DB pools on shutdown"""
+    preload_model()
+    reconcile = asyncio.create_task(_reconcile_decision_vectors())
+    yield
+    reconcile.cancel()
+    await async_engine.dispose()
+
+
+# orjson encodes the large list responses (messages, decisions, graph) in C
+app = FastAPI(
+    title="Inbox Context Graph API",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
-app = FastAPI(title="Inbox Context Graph API")
 
 # CORS
 app.add_middleware(
@@ -40,62 +70,103 @@ def root():
     return {"message": "Inbox Context Graph API"}
 
 
+@app.get("/metrics")
+def get_metrics():
+    """Cache effectiveness counters"""
+    return {"embedding_cache": embedding_cache_stats()}
+
+
 @app.get("/messages", response_model=List[MessageSchema])
-def get_messages(db: Session = Depends(get_db)):
+async def get_messages(db: AsyncSession = Depends(get_async_db)):
     """Get all inbox messages"""
-    messages = db.query(Message).order_by(Message.timestamp.desc()).all()
-    return messages
+    result = await db.execute(select(Message).order_by(Message.timestamp.desc()))
+    return result.scalars().all()
 
 
 @app.get("/messages/{message_id}", response_model=MessageSchema)
-def get_message(message_id: str, db: Session = Depends(get_db)):
+async def get_message(message_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get specific message"""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = await db.get(Message, message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     return message
 
 
 @app.post("/agent/suggest/{message_id}", response_model=AgentResponse)
-def get_agent_suggestion(message_id: str, use_llm: bool = True, db: Session = Depends(get_db)):
+async def get_agent_suggestion(
+    message_id: str,
+    use_llm: bool = True,
+    include_draft: bool = True,
+    db: Session = Depends(get_db)
+):
     """Get AI agent suggestion for a message
     
     Args:
         message_id: Message ID to analyze
         use_llm: Use LLM for intelligent reasoning (default: True)
+        include_draft: Generate the draft inline (default: True); set False
+            and stream it from /agent/draft/{message_id} instead
     
     Returns:
         AgentResponse with action, tone, reasoning, and optional draft
     """
-    message = db.query(Message).filter(Message.id == message_id).first()
+    # The sync session blocks; query it from a worker thread
+    message = await asyncio.to_thread(db.get, Message, message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
-    # Initialize agent with LLM support
-    agent = AgentEngine(db, use_llm=use_llm)
-    suggestion = agent.get_suggestion(message)
+    suggestion = await get_agent_engine().get_suggestion(
+        db, message, use_llm=use_llm, include_draft=include_draft
+    )
     
     return AgentResponse(**suggestion)
 
 
+@app.post("/agent/draft/{message_id}")
+async def stream_agent_draft(
+    message_id: str,
+    tone: Literal["warm", "neutral", "formal"] = "neutral",
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stream an LLM email draft for a message as plain text
+    
+    Args:
+        message_id: Message ID to reply to
+        tone: Draft tone (warm, neutral, formal)
+    """
+    message = await db.get(Message, message_id)
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    return StreamingResponse(_stream_draft(message, tone), media_type="text/plain")
+
+
+async def _stream_draft(message: Message, tone: str) -> AsyncIterator[str]:
+    """Stream the draft with a session for its context retrieval"""
+    # The session must outlive the handler, so the generator owns it
+    db = SessionLocal()
+    try:
+        async for chunk in get_agent_engine().stream_draft(db, message, tone):
+            yield chunk
+    finally:
+        db.close()
+
+
 @app.post("/decisions", response_model=DecisionTrace)
-def create_decision(decision_data: DecisionTraceCreate, db: Session = Depends(get_db)):
+async def create_decision(
+    decision_data: DecisionTraceCreate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
     """Capture a human decision trace"""
     
     # Verify message exists
-    message = db.query(Message).filter(Message.id == decision_data.message_id).first()
+    message = await db.get(Message, decision_data.message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
     # Create decision
-    decision = Decision(
-        id=str(uuid.uuid4()),
-        message_id=decision_data.message_id,
-        agent_suggestion=decision_data.agent_suggestion.dict(),
-        human_action=decision_data.human_action.dict(),
-        context_used=decision_data.context_used.dict(),
-        why=decision_data.why,
-    )
+    decision = _new_decision(decision_data)
     db.add(decision)
     
     # Create precedent links
@@ -107,30 +178,21 @@ def create_decision(decision_data: DecisionTraceCreate, db: Session = Depends(ge
         db.add(link)
     
     # Update graph nodes and edges
-    _update_graph(db, decision, message)
+    await _update_graph(db, decision, message)
     
-    db.commit()
-    db.refresh(decision)
+    await db.commit()
+    await db.refresh(decision)
     
-    # Store decision in vector store for future retrieval
-    try:
-        vector_store = get_vector_store()
-        decision_text = f"Decision for {message.sender_name}: {decision.human_action['action']} with {decision.human_action['tone']} tone. Message: {message.content[:200]}"
-        decision_embedding = get_embedding(decision_text)
-        vector_store.store(
-            id=f"decision_{decision.id}",
-            text=decision_text,
-            embedding=decision_embedding,
-            metadata={
-                "decision_id": decision.id,
-                "message_id": message.id,
-                "sender_type": message.sender_type,
-                "action": decision.human_action["action"],
-                "tone": decision.human_action["tone"]
-            }
-        )
-    except Exception as e:
-        print(f"Failed to store decision in vector store: {e}")
+    # New precedent for this sender type makes cached suggestions stale
+    get_suggestion_cache().invalidate(lambda key: key[0] == message.sender_type)
+    
+    # Store decision in vector store for future retrieval, after the response
+    background_tasks.add_task(
+        _persist_to_vector_store,
+        ids=[f"decision_{decision.id}"],
+        texts=[_decision_text(decision, message)],
+        metadatas=[_decision_metadata(decision, message)]
+    )
     
     return DecisionTrace(
         decision_id=decision.id,
@@ -143,10 +205,197 @@ def create_decision(decision_data: DecisionTraceCreate, db: Session = Depends(ge
     )
 
 
+@app.post("/decisions/batch", response_model=DecisionBatchResponse)
+async def create_decisions_batch(
+    batch: List[DecisionTraceCreate],
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Capture several decision traces in one transaction
+    
+    Decision texts are embedded and written to the vector store in batches
+    after the response is sent. A decision that cannot be stored (unknown
+    message, failed graph update) is reported in `errors` and does not
+    affect the others.
+    """
+    # Verify messages exist (one query for the whole batch)
+    message_ids = {item.message_id for item in batch}
+    messages = {
+        m.id: m
+        for m in (await db.execute(
+            select(Message).where(Message.id.in_(message_ids))
+        )).scalars()
+    }
+    
+    errors = []
+    stored = []
+    for index, item in enumerate(batch):
+        message = messages.get(item.message_id)
+        if message is None:
+            errors.append(DecisionBatchError(
+                index=index, message_id=item.message_id, error="Message not found"
+            ))
+            continue
+        decision = _new_decision(item)
+        # Savepoint per decision, so one failure doesn't sink the batch
+        try:
+            async with db.begin_nested():
+                db.add(decision)
+                db.add_all(
+                    DecisionPrecedent(decision_id=decision.id, precedent_id=precedent_id)
+                    for precedent_id in item.context_used.similar_decisions
+                )
+                await _update_graph(db, decision, message)
+            stored.append((item, decision, message))
+        except Exception as e:
+            print(f"Failed to store decision {index}: {e}")
+            errors.append(DecisionBatchError(
+                index=index, message_id=item.message_id, error=str(e)
+            ))
+    await db.commit()
+    
+    # New precedents make cached suggestions for these sender types stale
+    sender_types = {message.sender_type for _, _, message in stored}
+    get_suggestion_cache().invalidate(lambda key: key[0] in sender_types)
+    
+    # Store the committed decisions in the vector store, after the response
+    if stored:
+        background_tasks.add_task(
+            _persist_to_vector_store,
+            ids=[f"decision_{decision.id}" for _, decision, _ in stored],
+            texts=[_decision_text(decision, message) for _, decision, message in stored],
+            metadatas=[_decision_metadata(decision, message) for _, decision, message in stored]
+        )
+    
+    return DecisionBatchResponse(
+        decisions=[
+            DecisionTrace(
+                decision_id=decision.id,
+                message_id=decision.message_id,
+                agent_suggestion=item.agent_suggestion,
+                human_action=item.human_action,
+                context_used=item.context_used,
+                why=decision.why,
+                timestamp=decision.timestamp,
+            )
+            for item, decision, _ in stored
+        ],
+        errors=errors
+    )
+
+
+async def _persist_to_vector_store(
+    ids: List[str],
+    texts: List[str],
+    metadatas: List[dict]
+) -> None:
+    """Embed decisions and store them in the vector store (background task)
+    
+    Embeddings go through the micro-batcher, so decisions from concurrent
+    requests share model calls. Chroma writes are queued on the vector
+    store's writer thread (enqueued from a worker thread, since a full
+    queue blocks); failures are retried with exponential backoff.
+    """
+    try:
+        embeddings = await asyncio.gather(
+            *(get_batched_embedder().embed(text) for text in texts)
+        )
+    except Exception as e:
+        print(f"Failed to embed decisions for vector store: {e}")
+        return
+    
+    vector_store = get_vector_store()
+    for attempt in range(VECTOR_STORE_ATTEMPTS):
+        try:
+            # store_batch itself can block (back-pressure when the writer
+            # queue is full), so it is called from a worker thread too
+            write = await asyncio.to_thread(
+                vector_store.store_batch,
+                ids=ids,
+                texts=texts,
+                embeddings=embeddings,
+                metadatas=metadatas
+            )
+            await asyncio.wrap_future(write)
+            
+            # Suggestions computed since the commit were cached without these
+            # precedents in the vector store
+            sender_types = {metadata["sender_type"] for metadata in metadatas}
+            get_suggestion_cache().invalidate(lambda key: key[0] in sender_types)
+            return
+        except Exception as e:
+            print(f"Failed to store decisions in vector store (attempt {attempt + 1}): {e}")
+            if attempt + 1 < VECTOR_STORE_ATTEMPTS:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+
+async def _reconcile_decision_vectors() -> None:
+    """Store decisions that never reached the vector store (startup task)
+    
+    The vector write runs after the commit, so a restart in between or a
+    write that ran out of retries leaves a decision without its vector;
+    those are rebuilt from the decisions table.
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(Decision, Message).join(Message, Decision.message_id == Message.id)
+            )).all()
+        by_id = {f"decision_{decision.id}": (decision, message) for decision, message in rows}
+        missing = await asyncio.to_thread(get_vector_store().missing_ids, list(by_id))
+    except Exception as e:
+        print(f"Failed to check decisions against the vector store: {e}")
+        return
+    
+    if missing:
+        print(f"Storing {len(missing)} decision(s) missing from the vector store")
+        await _persist_to_vector_store(
+            ids=missing,
+            texts=[_decision_text(*by_id[id]) for id in missing],
+            metadatas=[_decision_metadata(*by_id[id]) for id in missing]
+        )
+
+
+def _new_decision(decision_data: DecisionTraceCreate) -> Decision:
+    """Decision row for a request, serialized with a single model_dump()"""
+    data = decision_data.model_dump()
+    return Decision(
+        id=str(uuid.uuid4()),
+        message_id=data["message_id"],
+        agent_suggestion=data["agent_suggestion"],
+        human_action=data["human_action"],
+        context_used=data["context_used"],
+        why=data["why"],
+    )
+
+
+def _decision_text(decision: Decision, message: Message) -> str:
+    """Text stored in the vector store for a decision"""
+    return f"Decision for {message.sender_name}: {decision.human_action['action']} with {decision.human_action['tone']} tone. Message: {message.content[:200]}"
+
+
+def _decision_metadata(decision: Decision, message: Message) -> dict:
+    """Vector store metadata for a decision"""
+    return {
+        "decision_id": decision.id,
+        "message_id": message.id,
+        "sender_type": message.sender_type,
+        "action": decision.human_action["action"],
+        "tone": decision.human_action["tone"]
+    }
+
+
 @app.get("/decisions", response_model=List[DecisionTrace])
-def get_decisions(db: Session = Depends(get_db)):
+async def get_decisions(db: AsyncSession = Depends(get_async_db)):
     """Get all decision traces"""
-    decisions = db.query(Decision).order_by(Decision.timestamp.desc()).all()
+    # The response reads only Decision columns; raise rather than lazy-load
+    # a relationship per row if that ever changes
+    result = await db.execute(
+        select(Decision)
+        .options(raiseload("*"))
+        .order_by(Decision.timestamp.desc())
+    )
+    decisions = result.scalars().all()
     
     result = []
     for d in decisions:
@@ -165,22 +414,45 @@ def get_decisions(db: Session = Depends(get_db)):
 
 
 @app.get("/graph", response_model=GraphResponse)
-def get_graph(db: Session = Depends(get_db)):
-    """Get context graph for visualization"""
-    nodes = db.query(GraphNode).all()
-    edges = db.query(GraphEdge).all()
-    
-    node_responses = [
-        GraphNodeResponse(id=n.id, type=n.node_type, label=n.label)
-        for n in nodes
-    ]
+async def get_graph():
+    """Get context graph for visualization
     
-    edge_responses = [
-        GraphEdgeResponse(id=e.id, source=e.source_id, target=e.target_id, type=e.edge_type)
-        for e in edges
-    ]
-    
-    return GraphResponse(nodes=node_responses, edges=edge_responses)
+    Streams the GraphResponse JSON as rows arrive from a server-side cursor,
+    so memory stays flat however large the graph grows.
+    """
+    return StreamingResponse(_stream_graph(), media_type="application/json")
+
+
+async def _stream_graph() -> AsyncIterator[bytes]:
+    """Encode the graph as JSON one fetched batch at a time"""
+    # The session must outlive the handler, so the generator owns it
+    async with AsyncSessionLocal() as db:
+        yield b'{"nodes":['
+        nodes = await db.stream(
+            select(GraphNode.id, GraphNode.node_type, GraphNode.label)
+            .execution_options(yield_per=GRAPH_STREAM_BATCH)
+        )
+        separator = b""
+        async for rows in nodes.partitions():
+            yield separator + b",".join(
+                orjson.dumps({"id": id, "type": node_type, "label": label})
+                for id, node_type, label in rows
+            )
+            separator = b","
+        
+        yield b'],"edges":['
+        edges = await db.stream(
+            select(GraphEdge.id, GraphEdge.source_id, GraphEdge.target_id, GraphEdge.edge_type)
+            .execution_options(yield_per=GRAPH_STREAM_BATCH)
+        )
+        separator = b""
+        async for rows in edges.partitions():
+            yield separator + b",".join(
+                orjson.dumps({"id": id, "source": source, "target": target, "type": edge_type})
+                for id, source, target, edge_type in rows
+            )
+            separator = b","
+        yield b"]}"
 
 
 @app.get("/context/retrieve")
@@ -200,10 +472,8 @@ def retrieve_context(
     Returns:
         Ranked context with sources and scores
     """
-    from retriever import HybridRetriever
-    
-    retriever = HybridRetriever(db)
-    results = retriever.retrieve(
+    results = get_hybrid_retriever().retrieve(
+        db,
         query=query,
         sender_type=sender_type,
         top_k=top_k,
@@ -221,47 +491,44 @@ def retrieve_context(
 
 
 @app.post("/reset")
-def reset_demo(db: Session = Depends(get_db)):
+async def reset_demo(db: AsyncSession = Depends(get_async_db)):
     """Reset all decisions and graph (keep messages)"""
-    db.query(DecisionPrecedent).delete()
-    db.query(Decision).delete()
-    db.query(GraphNode).delete()
-    db.query(GraphEdge).delete()
-    db.commit()
+    await db.execute(delete(DecisionPrecedent))
+    await db.execute(delete(Decision))
+    await db.execute(delete(GraphNode))
+    await db.execute(delete(GraphEdge))
+    await db.commit()
+    get_suggestion_cache().invalidate()
     
-    # Also reset vector store decisions (keep messages)
+    # Also reset vector store decisions (keep messages), so stale decision
+    # vectors don't keep growing the index every search walks
     try:
         vector_store = get_vector_store()
-        # Note: ChromaDB doesn't have easy prefix delete, so we'd need to query and delete
-        # For simplicity, we'll just clear decision_ prefixed items if needed
+        await asyncio.to_thread(vector_store.delete_prefix, "decision_")
     except Exception as e:
         print(f"Vector store reset warning: {e}")
     
     return {"message": "Demo reset complete"}
 
 
-def _update_graph(db: Session, decision: Decision, message: Message):
+async def _update_graph(db: AsyncSession, decision: Decision, message: Message):
     """Update graph nodes and edges for visualization"""
     
-    # Create/get message node
-    msg_node = db.query(GraphNode).filter(
-        GraphNode.node_type == "message"
-    ).all()
-    
-    # Find existing message node by checking properties
-    msg_node_found = None
-    for node in msg_node:
-        if node.properties and node.properties.get("message_id") == message.id:
-            msg_node_found = node
-            break
-    msg_node = msg_node_found
+    # Create/get message node (indexed lookup by message id)
+    msg_node = (await db.execute(
+        select(GraphNode).where(
+            GraphNode.node_type == "message",
+            GraphNode.message_ref_id == message.id
+        )
+    )).scalars().first()
     
     if not msg_node:
         msg_node = GraphNode(
             id=f"msg_{message.id[:8]}",
             node_type="message",
             label=f"{message.sender_name}\n{message.sender_type}",
-            properties={"message_id": message.id}
+            properties={"message_id": message.id},
+            message_ref_id=message.id
         )
         db.add(msg_node)
     
@@ -274,65 +541,60 @@ def _update_graph(db: Session, decision: Decision, message: Message):
     )
     db.add(decision_node)
     
-    # Create action node
-    action_id = f"action_{decision.human_action['action']}"
-    action_node = db.query(GraphNode).filter(GraphNode.id == action_id).first()
-    if not action_node:
-        action_node = GraphNode(
-            id=action_id,
-            node_type="action",
-            label=decision.human_action['action'],
-            properties={}
-        )
-        db.add(action_node)
-    
-    # Create tone node
-    tone_id = f"tone_{decision.human_action['tone']}"
-    tone_node = db.query(GraphNode).filter(GraphNode.id == tone_id).first()
-    if not tone_node:
-        tone_node = GraphNode(
-            id=tone_id,
-            node_type="tone",
-            label=decision.human_action['tone'],
-            properties={}
-        )
-        db.add(tone_node)
-    
-    # Create sender_type node
+    # Look up the action, tone and sender_type nodes and the precedent
+    # decision nodes in a single round-trip
+    action = decision.human_action['action']
+    tone = decision.human_action['tone']
+    action_id = f"action_{action}"
+    tone_id = f"tone_{tone}"
     sender_type_id = f"sender_{message.sender_type}"
-    sender_node = db.query(GraphNode).filter(GraphNode.id == sender_type_id).first()
-    if not sender_node:
-        sender_node = GraphNode(
-            id=sender_type_id,
-            node_type="sender_type",
-            label=message.sender_type,
-            properties={}
+    singleton_nodes = {
+        action_id: ("action", action),
+        tone_id: ("tone", tone),
+        sender_type_id: ("sender_type", message.sender_type),
+    }
+    precedent_node_ids = [
+        f"dec_{precedent_id[:8]}"
+        for precedent_id in decision.context_used.get("similar_decisions", [])
+    ]
+    existing_ids = set((await db.execute(
+        select(GraphNode.id).where(
+            GraphNode.id.in_([*singleton_nodes, *precedent_node_ids])
         )
-        db.add(sender_node)
+    )).scalars())
+    
+    # Create only the missing action/tone/sender_type nodes (one multi-row INSERT)
+    new_nodes = [
+        {"id": node_id, "node_type": node_type, "label": label, "properties": {}}
+        for node_id, (node_type, label) in singleton_nodes.items()
+        if node_id not in existing_ids
+    ]
+    if new_nodes:
+        await db.execute(insert(GraphNode), new_nodes)
     
     # Create edges
     edges = [
-        GraphEdge(source_id=msg_node.id, target_id=decision_node.id, edge_type="has_decision"),
-        GraphEdge(source_id=decision_node.id, target_id=action_node.id, edge_type="chose_action"),
-        GraphEdge(source_id=decision_node.id, target_id=tone_node.id, edge_type="chose_tone"),
-        GraphEdge(source_id=decision_node.id, target_id=sender_node.id, edge_type="from_sender_type"),
+        {"source_id": msg_node.id, "target_id": decision_node.id, "edge_type": "has_decision"},
+        {"source_id": decision_node.id, "target_id": action_id, "edge_type": "chose_action"},
+        {"source_id": decision_node.id, "target_id": tone_id, "edge_type": "chose_tone"},
+        {"source_id": decision_node.id, "target_id": sender_type_id, "edge_type": "from_sender_type"},
     ]
     
-    for edge in edges:
-        db.add(edge)
-    
-    # Add precedent edges
-    for precedent_id in decision.context_used.get("similar_decisions", []):
-        precedent = db.query(Decision).filter(Decision.id == precedent_id).first()
-        if precedent:
-            prec_node_id = f"dec_{precedent.id[:8]}"
-            edge = GraphEdge(
-                source_id=decision_node.id,
-                target_id=prec_node_id,
-                edge_type="based_on_precedent"
-            )
-            db.add(edge)
-
+    # Add precedent edges (only to precedents that are in the graph)
+    edges.extend(
+        {
+            "source_id": decision_node.id,
+            "target_id": prec_node_id,
+            "edge_type": "based_on_precedent"
+        }
+        for prec_node_id in precedent_node_ids
+        if prec_node_id in existing_ids
+    )
+    
+    await db.execute(
+        insert(GraphEdge),
+        [{"id": str(uuid.uuid4()), **edge} for edge in edges]
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,7 +1,10 @@
-from sqlalchemy import Column, String, DateTime, JSON, ForeignKey, Text, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, DateTime, JSON, ForeignKey, Text, Float, LargeBinary, Index
+from sqlalchemy.orm import relationship, validates
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
+from typing import Tuple
 from database import Base
+import numpy as np
 import uuid
 
 
@@ -9,8 +12,77 @@ def generate_uuid():
     return str(uuid.uuid4())
 
 
+class NormalizedVector(TypeDecorator):
+    """Embedding stored as raw float32 bytes, L2-normalized on write
+    
+    Reads return a float32 numpy array, so cosine similarity against a
+    normalized query is a plain dot product.
+    """
+    impl = LargeBinary
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        vec = np.asarray(value, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        return vec.tobytes()
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return np.frombuffer(value, dtype=np.float32)
+
+
+# Dequantization scale of int8 rows written before per-vector scales existed
+LEGACY_INT8_SCALE = 1 / 127
+
+
+def quantize_int8(value) -> Tuple[np.ndarray, float]:
+    """Quantize a vector to int8 after L2 normalization, with a per-vector scale
+    
+    The largest component maps to +/-127, so the full int8 range is used
+    (normalized components are typically far below 1). q * scale ~= the
+    unit vector, and q_a . q_b * scale_a * scale_b ~= cosine similarity.
+    
+    Returns:
+        Tuple of (int8 vector, float scale)
+    """
+    vec = np.asarray(value, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    if norm > 0:
+        vec = vec / norm
+    max_abs = float(np.max(np.abs(vec))) if vec.size else 0.0
+    if max_abs == 0:
+        return np.zeros(vec.shape, dtype=np.int8), 0.0
+    q = np.clip(np.round(vec / max_abs * 127), -127, 127).astype(np.int8)
+    return q, max_abs / 127
+
+
+class Int8Vector(TypeDecorator):
+    """int8-quantized embedding stored as raw bytes (4x smaller than float32)"""
+    impl = LargeBinary
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return np.asarray(value, dtype=np.int8).tobytes()
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return np.frombuffer(value, dtype=np.int8)
+
+
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Sender-type scoped scans, newest first (graph search candidates)
+        Index("ix_messages_sender_type_timestamp", "sender_type", "timestamp"),
+    )
     
     id = Column(String, primary_key=True, default=generate_uuid)
     sender_name = Column(String, nullable=False)
@@ -18,22 +90,32 @@ class Message(Base):
     channel = Column(String, nullable=False)  # email, slack, discord
     subject = Column(String)
     content = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    embedding = Column(JSON)  # Store as array
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    embedding = Column(NormalizedVector)  # Unit-length float32 vector
+    embedding_q8 = Column(Int8Vector)  # int8 copy for bandwidth-bound scans
+    embedding_q8_scale = Column(Float)  # q8 * scale ~= embedding (NULL on legacy rows)
     
-    decisions = relationship("Decision", back_populates="message")
+    decisions = relationship("Decision", back_populates="message", lazy="raise")
+    
+    @validates("embedding")
+    def _sync_quantized_embedding(self, key, value):
+        if value is None:
+            self.embedding_q8, self.embedding_q8_scale = None, None
+        else:
+            self.embedding_q8, self.embedding_q8_scale = quantize_int8(value)
+        return value
 
 
 class Decision(Base):
     __tablename__ = "decisions"
     
     id = Column(String, primary_key=True, default=generate_uuid)
-    message_id = Column(String, ForeignKey("messages.id"), nullable=False)
+    message_id = Column(String, ForeignKey("messages.id"), nullable=False, index=True)
     agent_suggestion = Column(JSON, nullable=False)  # {action, tone}
     human_action = Column(JSON, nullable=False)  # {action, tone}
     context_used = Column(JSON, nullable=False)  # {sender_type, similar_decisions}
     why = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     
     message = relationship("Message", back_populates="decisions")
     precedent_links = relationship(
@@ -48,7 +130,7 @@ class DecisionPrecedent(Base):
     __tablename__ = "decision_precedents"
     
     id = Column(String, primary_key=True, default=generate_uuid)
-    decision_id = Column(String, ForeignKey("decisions.id"), nullable=False)
+    decision_id = Column(String, ForeignKey("decisions.id"), nullable=False, index=True)
     precedent_id = Column(String, ForeignKey("decisions.id"), nullable=False)
     
     decision = relationship("Decision", foreign_keys=[decision_id], back_populates="precedent_links")
@@ -63,11 +145,17 @@ class GraphNode(Base):
     node_type = Column(String, nullable=False)  # message, decision, sender_type, action, tone
     label = Column(String, nullable=False)
     properties = Column(JSON)
+    message_ref_id = Column(String, index=True, nullable=True)  # Set on message nodes
 
 
 class GraphEdge(Base):
     """Edge table for graph visualization"""
     __tablename__ = "graph_edges"
+    __table_args__ = (
+        # Covers source_id-only lookups too (leftmost prefix)
+        Index("ix_graph_edges_source_id_edge_type", "source_id", "edge_type"),
+        Index("ix_graph_edges_target_id", "target_id"),
+    )
     
     id = Column(String, primary_key=True, default=generate_uuid)
     source_id = Column(String, nullable=False)
@@ -1,5 +1,22 @@
 """Prompt templates for LLM generation"""
 from typing import List, Dict, Optional
+from functools import lru_cache
+from types import MappingProxyType
+
+__all__ = [
+    "build_email_draft_prompt",
+    "build_intent_analysis_prompt",
+    "build_suggestion_system_prompt",
+    "build_suggestion_prompt",
+    "build_precedent_summary_prompt",
+    "build_style_learning_prompt",
+    "build_decision_explanation_prompt",
+    "get_tone_description",
+    "get_sender_context",
+    "DEFAULT_SYSTEM_PROMPT",
+    "TONE_DESCRIPTIONS",
+    "SENDER_TYPE_CONTEXT",
+]
 
 
 def build_email_draft_prompt(
@@ -24,45 +41,27 @@ def build_email_draft_prompt(
         Tuple of (system_prompt, user_prompt)
     """
     
-    # Build system prompt with tone-specific guidance
-    tone_guidance = TONE_DESCRIPTIONS.get(tone, "professional")
-    
-    system_prompt = f"""You are an expert AI email assistant that drafts natural, contextually-aware replies.
-
-Your writing style should be:
-- {tone_guidance}
-- Concise but complete (under 100 words)
-- Natural and human-like, not robotic
-- Context-aware: reference past interactions when relevant
-- Action-oriented: always include a clear next step
-
-Key principles:
-1. Address the sender's main points directly
-2. Use the same communication style as past successful interactions
-3. Be authentic - write as the user would write
-4. Avoid generic templates or overly formal language unless tone is 'formal'
-5. End with a clear call-to-action or next step"""
+    # System prompt varies only by tone
+    system_prompt = _draft_system_prompt(tone)
     
     # Build context section
     context_str = ""
     if retrieved_context:
-        context_str = "\n### Past Context:\n"
+        lines = ["\n### Past Context:"]
         for i, ctx in enumerate(retrieved_context[:3], 1):
             source = ctx.get("source", "unknown")
             text = ctx.get("text", "")[:200]
-            context_str += f"{i}. [{source}] {text}...\n"
+            lines.append(f"{i}. [{source}] {text}...")
+        context_str = "\n".join(lines) + "\n"
     
     # Build style preferences
     style_str = ""
     if user_preferences:
-        formality = user_preferences.get("formality_level", "medium")
-        length = user_preferences.get("avg_response_length", 50)
-        emoji = user_preferences.get("emoji_usage", False)
-        
-        style_str = f"\n### Your Writing Style:\n"
-        style_str += f"- Formality: {formality}\n"
-        style_str += f"- Typical length: ~{length} words\n"
-        style_str += f"- Emoji usage: {'Yes' if emoji else 'No'}\n"
+        style_str = _style_block(
+            user_preferences.get("formality_level", "medium"),
+            user_preferences.get("avg_response_length", 50),
+            bool(user_preferences.get("emoji_usage", False))
+        )
     
     # Build user prompt
     user_prompt = f"""### Incoming Message:
@@ -78,15 +77,54 @@ Draft:"""
     return system_prompt, user_prompt
 
 
+@lru_cache(maxsize=8)
+def _draft_system_prompt(tone: str) -> str:
+    """System prompt for email drafts with tone-specific guidance"""
+    tone_guidance = TONE_DESCRIPTIONS.get(tone, "professional")
+    
+    return f"""You are an expert AI email assistant that drafts natural, contextually-aware replies.
+
+Your writing style should be:
+- {tone_guidance}
+- Concise but complete (under 100 words)
+- Natural and human-like, not robotic
+- Context-aware: reference past interactions when relevant
+- Action-oriented: always include a clear next step
+
+Key principles:
+1. Address the sender's main points directly
+2. Use the same communication style as past successful interactions
+3. Be authentic - write as the user would write
+4. Avoid generic templates or overly formal language unless tone is 'formal'
+5. End with a clear call-to-action or next step"""
+
+
+@lru_cache(maxsize=64)
+def _style_block(formality: str, length: int, emoji: bool) -> str:
+    """Writing-style section for the draft prompt"""
+    return "".join([
+        "\n### Your Writing Style:\n",
+        f"- Formality: {formality}\n",
+        f"- Typical length: ~{length} words\n",
+        f"- Emoji usage: {'Yes' if emoji else 'No'}\n",
+    ])
+
+
 def build_intent_analysis_prompt(
     message_content: str
 ) -> str:
     """Build prompt for deep message intent analysis"""
     
-    return f"""Analyze this message deeply and extract ALL key information:
+    return _INTENT_ANALYSIS_PREFIX + message_content + _INTENT_ANALYSIS_SUFFIX
+
+
+# Constant parts of the intent analysis prompt, built once at import
+_INTENT_ANALYSIS_PREFIX = """Analyze this message deeply and extract ALL key information:
 
 Message:
-{message_content}
+"""
+
+_INTENT_ANALYSIS_SUFFIX = """
 
 Analyze and provide:
 1. Primary Intent: Choose the MOST specific from [question, information_request, meeting_request, update, urgent_request, complaint, feedback, casual_check_in, sales_pitch, partnership_proposal, investment_inquiry, support_request, follow_up, introduction]
@@ -100,11 +138,66 @@ Be specific and precise. Consider:
 - Emotional tone and sentiment
 - Business context and importance
 
-Format your response EXACTLY as:
-Intent: [your choice]
-Topics: [topic1, topic2, topic3]
-Urgency: [your choice]
-Action: [yes/no - specific description]"""
+Respond with a single JSON object with EXACTLY these keys:
+{"intent": "<your choice>", "topics": ["topic1", "topic2", "topic3"], "urgency": "<your choice>", "requires_action": true, "action_description": "<specific action needed, or empty>"}"""
+
+
+@lru_cache(maxsize=None)
+def build_suggestion_system_prompt(sender_type: str) -> str:
+    """Build the invariant instructions for action/tone suggestions
+    
+    The result is byte-identical for a given sender type, so backends with
+    prefix caching can skip prefill for it on every call.
+    """
+    
+    return f"""You are an intelligent inbox assistant analyzing a message to suggest the best action.
+
+### Sender Context:
+{sender_type}: {get_sender_context(sender_type)}
+
+### Your Task:
+Based on ALL the information provided, suggest:
+1. **Action**: Choose from [reply_now, reply_later, ignore]
+2. **Tone**: Choose from [warm, neutral, formal]
+3. **Reasoning**: Explain your decision in 2-3 sentences, referencing specific precedents and context.
+
+Consider:
+- The sender's importance and your past interactions
+- The message's urgency and complexity
+- Patterns in your previous decisions
+- The specific intent and topics of this message
+
+Respond with a single JSON object with EXACTLY these keys:
+{{"action": "<your choice>", "tone": "<your choice>", "reasoning": "<your detailed reasoning>"}}"""
+
+
+def build_suggestion_prompt(
+    sender_name: str,
+    sender_type: str,
+    subject: Optional[str],
+    content: str,
+    analysis: Dict,
+    precedent_summary: str,
+    context_summary: str
+) -> str:
+    """Build the per-message part of the suggestion prompt"""
+    
+    return f"""### Message Details:
+From: {sender_name} ({sender_type})
+Subject: {subject or 'N/A'}
+Content: {content}
+
+### Message Analysis:
+- Intent: {analysis.get('intent', 'unknown')}
+- Topics: {', '.join(analysis.get('topics', ['general']))}
+- Urgency: {analysis.get('urgency', 'medium')}
+- Requires Action: {analysis.get('requires_action', False)}
+
+### Past Decisions (Your Precedents):
+{precedent_summary}
+
+### Related Context:
+{context_summary}"""
 
 
 def build_precedent_summary_prompt(
@@ -186,17 +279,18 @@ Always consider:
 3. Patterns in how the user handles similar situations
 4. The broader context and implications of the message"""
 
-TONE_DESCRIPTIONS = {
+# Read-only lookup tables (the memoized getters below depend on them not changing)
+TONE_DESCRIPTIONS = MappingProxyType({
     "warm": "friendly, enthusiastic, personal, showing genuine interest and care",
     "neutral": "professional, balanced, straightforward, matter-of-fact",
     "formal": "respectful, traditional, structured, maintaining clear boundaries"
-}
+})
 
-SENDER_TYPE_CONTEXT = {
+SENDER_TYPE_CONTEXT = MappingProxyType({
     "investor": "Important stakeholder requiring timely, informative responses",
     "sales": "Business inquiry requiring professional evaluation",
     "support": "User needing helpful assistance and guidance"
-}
+})
 
 
 def get_tone_description(tone: str) -> str:
@@ -1,29 +1,172 @@
 """Cross-encoder reranking for better result ordering"""
 from sentence_transformers import CrossEncoder
-from typing import List, Dict, Tuple
+from concurrent.futures import Future
+from typing import List, Dict, Tuple, Optional, Any
 from functools import lru_cache
+from cachetools import LRUCache
+import hashlib
+import heapq
+import queue
+import threading
+import time
+import numpy as np
+import torch
+
+from embeddings import ONNX_FILE_NAME, _onnx_session_options
+
+RERANKER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+# Pairs per forward pass; with length-sorted input each batch pads to its own max
+RERANK_BATCH_SIZE = 32
+
+# Predict calls queued behind another share its model call, waiting up to
+# this window (seconds) for more, up to this many pairs
+MICRO_BATCH_WINDOW = 0.005
+MICRO_BATCH_MAX_PAIRS = 64
+
+# Cross-encoder scores keyed by (query digest, document digest); shared
+# process-wide so repeated precedents skip the forward pass
+_score_cache = LRUCache(maxsize=10_000)
+_score_cache_lock = threading.Lock()
+
+
+def _digest(text: str) -> bytes:
+    """Compact cache key for a query or document"""
+    return hashlib.blake2b(text.encode(), digest_size=8).digest()
 
 
 @lru_cache(maxsize=1)
 def get_reranker_model():
-    """Load and cache cross-encoder model"""
+    """Load and cache cross-encoder model
+    
+    On a CUDA GPU, runs the PyTorch model in fp16 (tensor-core GEMMs). On
+    CPU, prefers the int8 ONNX Runtime export from the model repo (same
+    file and session settings as the embedding model); falls back to
+    PyTorch, in bf16 where the CPU supports it natively.
+    """
     print("Loading cross-encoder model...")
-    model = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-    print("Reranker model loaded!")
+    if torch.cuda.is_available():
+        model = CrossEncoder(RERANKER_MODEL_NAME, device='cuda')
+        model.model.half()
+        model.model.eval()
+        print("Reranker model loaded (CUDA, fp16)!")
+        return model
+    
+    try:
+        model = CrossEncoder(
+            RERANKER_MODEL_NAME,
+            backend='onnx',
+            model_kwargs={
+                'file_name': ONNX_FILE_NAME,
+                'provider': 'CPUExecutionProvider',
+                'session_options': _onnx_session_options()
+            }
+        )
+        print("Reranker model loaded (ONNX Runtime, int8)!")
+    except Exception as e:
+        print(f"ONNX reranker unavailable ({e}), using PyTorch")
+        model = CrossEncoder(RERANKER_MODEL_NAME)
+        if _cpu_supports_bf16():
+            model.model.to(torch.bfloat16)
+            print("Reranker model loaded (bf16)!")
+        else:
+            print("Reranker model loaded!")
     return model
 
 
+def _cpu_supports_bf16() -> bool:
+    """True if the CPU has native bf16 matmul (AVX-512 BF16)"""
+    check = getattr(torch.cpu, "_is_avx512_bf16_supported", None)
+    try:
+        return bool(check and check())
+    except Exception:
+        return False
+
+
+class _PredictBatcher:
+    """Coalesce concurrent predict calls into shared forward passes
+    
+    Retrieval runs on worker threads, so each caller queues its pairs and
+    blocks on a Future; one background thread takes the next job and,
+    if others are already queued behind it, keeps collecting for up to
+    MICRO_BATCH_WINDOW (a lone job runs at once). It then runs a single
+    length-sorted predict over all of them and hands each caller its
+    slice of the scores.
+    """
+    
+    def __init__(self, model):
+        self.model = model
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="reranker-batcher", daemon=True
+        )
+        self._thread.start()
+    
+    def predict(self, pairs: List[List[str]], lengths: List[int]) -> np.ndarray:
+        """Scores for pairs (with document token lengths), in input order"""
+        future = Future()
+        self._queue.put((pairs, lengths, future))
+        return future.result()
+    
+    def _run(self) -> None:
+        while True:
+            jobs = [self._queue.get()]
+            size = len(jobs[0][0])
+            deadline = time.monotonic() + MICRO_BATCH_WINDOW
+            while size < MICRO_BATCH_MAX_PAIRS:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    # Nothing else in flight: don't make a lone call wait
+                    if len(jobs) == 1:
+                        break
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        job = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                jobs.append(job)
+                size += len(job[0])
+            
+            pairs = [pair for job in jobs for pair in job[0]]
+            lengths = [length for job in jobs for length in job[1]]
+            try:
+                # Order pairs by document token length so each batch pads
+                # only to its own longest document, not the longest overall
+                order = np.argsort(lengths, kind="stable")
+                scores = np.empty(len(pairs), dtype=np.float32)
+                scores[order] = self.model.predict(
+                    [pairs[i] for i in order], batch_size=RERANK_BATCH_SIZE
+                )
+            except Exception as e:
+                for _, _, future in jobs:
+                    future.set_exception(e)
+                continue
+            
+            start = 0
+            for job_pairs, _, future in jobs:
+                future.set_result(scores[start:start + len(job_pairs)])
+                start += len(job_pairs)
+
+
 class Reranker:
     """Rerank search results using cross-encoder"""
     
     def __init__(self):
         """Initialize reranker"""
         self.model = None
+        self.batcher = None
+        self._load_lock = threading.Lock()
     
     def _ensure_model(self):
-        """Lazy load model on first use"""
+        """Lazy load model (and its batcher) on first use"""
         if self.model is None:
-            self.model = get_reranker_model()
+            with self._load_lock:
+                if self.model is None:
+                    self.batcher = _PredictBatcher(get_reranker_model())
+                    self.model = self.batcher.model
     
     def rerank(
         self,
@@ -44,18 +187,17 @@ class Reranker:
         if not documents:
             return []
         
-        self._ensure_model()
-        
-        # Create query-document pairs
-        pairs = [[query, doc] for doc in documents]
-        
-        # Get relevance scores
-        scores = self.model.predict(pairs)
+        # Get relevance scores (cached or predicted) in document order
+        scores = self._predict([(query, doc) for doc in documents])
         
         # Create (index, score) tuples
         results = [(i, float(score)) for i, score in enumerate(scores)]
         
-        # Sort by score (descending)
+        # Select top-k with a bounded heap when it is much smaller than N,
+        # otherwise sort by score (descending)
+        if top_k and top_k < len(results) // 4:
+            return heapq.nlargest(top_k, results, key=lambda x: x[1])
+        
         results.sort(key=lambda x: x[1], reverse=True)
         
         # Return top-k if specified
@@ -67,24 +209,35 @@ class Reranker:
     def rerank_with_metadata(
         self,
         query: str,
-        results: List[Dict],
+        results: List[Any],
         text_key: str = "text",
-        top_k: int = None
-    ) -> List[Dict]:
+        top_k: int = None,
+        text_attr: Optional[str] = None
+    ) -> List[Any]:
         """Rerank results that include metadata
         
         Args:
             query: Search query
-            results: List of result dicts
+            results: List of result dicts, or objects if text_attr is given
             text_key: Key in dict that contains text
             top_k: Number of results to return
+            text_attr: Attribute holding the text on result objects
             
         Returns:
-            Reranked list of result dicts with added 'rerank_score'
+            Reranked list of results with added 'rerank_score'. Results are
+            updated in place (key or attribute) and returned by reference,
+            not copied; only the top_k survivors are touched.
         """
         if not results:
             return []
         
+        if text_attr is not None:
+            documents = [getattr(r, text_attr) for r in results]
+            reranked = self.rerank(query, documents, top_k=top_k)
+            for idx, score in reranked:
+                results[idx].rerank_score = score
+            return [results[idx] for idx, _ in reranked]
+        
         # Extract documents
         documents = [r.get(text_key, "") for r in results]
         
@@ -94,7 +247,7 @@ class Reranker:
         # Build reranked results
         reranked_results = []
         for idx, score in reranked:
-            result = results[idx].copy()
+            result = results[idx]
             result['rerank_score'] = score
             reranked_results.append(result)
         
@@ -115,15 +268,53 @@ class Reranker:
         if not query_doc_pairs:
             return []
         
+        scores = self._predict(list(query_doc_pairs))
+        
+        return [float(s) for s in scores]
+    
+    def _token_lengths(self, documents: List[str]) -> List[int]:
+        """Token count of each document (no special tokens)"""
+        return [
+            len(ids) for ids in
+            self.model.tokenizer(documents, add_special_tokens=False)["input_ids"]
+        ]
+    
+    def _predict(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """Cross-encoder scores for (query, document) pairs, in input order
+        
+        Pairs already scored are served from the LRU cache; only the rest
+        go through the model, and their scores are cached.
+        """
+        query_digests = {q: _digest(q) for q, _ in pairs}
+        keys = [(query_digests[q], _digest(d)) for q, d in pairs]
+        scores = np.empty(len(pairs), dtype=np.float32)
+        missing = []
+        with _score_cache_lock:
+            for i, key in enumerate(keys):
+                cached = _score_cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    scores[i] = cached
+        
+        if not missing:
+            return scores
+        
         self._ensure_model()
         
-        # Convert to list of lists
-        pairs = [[q, d] for q, d in query_doc_pairs]
+        # Document lengths let the batcher sort pairs to minimize padding
+        lengths = self._token_lengths([pairs[i][1] for i in missing])
         
-        # Get scores
-        scores = self.model.predict(pairs)
+        # Scatter the new scores back to their original positions
+        scores[missing] = self.batcher.predict(
+            [[pairs[i][0], pairs[i][1]] for i in missing], lengths
+        )
         
-        return [float(s) for s in scores]
+        with _score_cache_lock:
+            for i in missing:
+                _score_cache[keys[i]] = float(scores[i])
+        
+        return scores
 
 
 # Global instance
@@ -1,30 +1,113 @@
 """Unified hybrid retriever combining multiple search strategies"""
-from typing import List, Dict, Optional
-from sqlalchemy.orm import Session
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+from sqlalchemy.orm import Session, contains_eager
+import numpy as np
+import threading
 
-from embeddings import get_embedding
+from embeddings import get_cached_embedding_array, mmr_indices
 from vector_store import get_vector_store
 from keyword_search import get_keyword_searcher
 from reranker import get_reranker
-from models import Decision, Message
+from retriever_kernels import int8_dot_scores
+from models import Decision, Message, quantize_int8
+from embedding_matrix import get_message_embedding_matrix
+from prompts import SENDER_TYPE_CONTEXT
+
+# Recent decisions per sender type considered for similarity ranking
+GRAPH_CANDIDATE_POOL = 500
+
+# MMR trade-off for precedents (1.0 = pure similarity, lower = more diverse)
+GRAPH_MMR_LAMBDA = 0.7
+
+# Weights for a message matched by both vector and keyword search
+VECTOR_WEIGHT = 1.0
+KEYWORD_WEIGHT = 1.0
+
+# Workers for the search branches that don't touch the DB session
+_search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retriever")
+
+# The BM25 index is process-wide state shared by every retriever instance
+_keyword_index_built = False
+_keyword_index_lock = threading.Lock()
+
+
+@dataclass(slots=True)
+class Hit:
+    """One search result; converted to a dict only when leaving retrieve()"""
+    id: str
+    text: str
+    score: float
+    metadata: Dict
+    source: str
+    rerank_score: Optional[float] = None
+    
+    def to_dict(self) -> Dict:
+        """Result dict as returned to callers"""
+        result = {
+            "id": self.id,
+            "text": self.text,
+            "score": self.score,
+            "metadata": self.metadata,
+            "source": self.source
+        }
+        if self.rerank_score is not None:
+            result["rerank_score"] = self.rerank_score
+        return result
+
+
+def _ensure_keyword_index(db: Session) -> None:
+    """Build the shared BM25 index from the database once per process"""
+    global _keyword_index_built
+    if _keyword_index_built:
+        return
+    
+    with _keyword_index_lock:
+        if _keyword_index_built:
+            return
+        messages = db.query(Message).all()
+        get_keyword_searcher().index_messages([{
+            "id": m.id,
+            "content": m.content,
+            "subject": m.subject,
+            "sender_name": m.sender_name,
+            "sender_type": m.sender_type,
+            "channel": m.channel,
+            "timestamp": m.timestamp
+        } for m in messages])
+        _keyword_index_built = True
+
+
+def _sender_filter_name(sender_type: str) -> str:
+    """Name of the prepared vector filter for a sender type"""
+    return f"sender_type:{sender_type}"
 
 
 class HybridRetriever:
-    """Combine vector, graph, and keyword search with reranking"""
+    """Combine vector, graph, and keyword search with reranking
     
-    def __init__(self, db: Session):
-        """Initialize retriever
-        
-        Args:
-            db: Database session
-        """
-        self.db = db
+    Holds only process-wide state (vector store, BM25 index, reranker), so
+    one instance serves every request; the session is passed per call.
+    """
+    
+    def __init__(self):
+        """Initialize retriever"""
         self.vector_store = get_vector_store()
         self.keyword_searcher = get_keyword_searcher()
         self.reranker = get_reranker()
+        
+        # Prepared vector filters for the known sender types; any other
+        # value is passed as a plain where filter (never registered)
+        for sender_type in SENDER_TYPE_CONTEXT:
+            self.vector_store.prepare_filter(
+                _sender_filter_name(sender_type), {"sender_type": sender_type}
+            )
     
     def retrieve(
         self,
+        db: Session,
         query: str,
         sender_type: Optional[str] = None,
         top_k: int = 5,
@@ -36,6 +119,7 @@ class HybridRetriever:
         """Hybrid retrieval with multiple strategies
         
         Args:
+            db: Database session
             query: Search query
             sender_type: Filter by sender type
             top_k: Final number of results
@@ -47,64 +131,97 @@ class HybridRetriever:
         Returns:
             List of ranked results with scores and sources
         """
-        all_results = []
+        all_results: List[Hit] = []
+        vector_results: List[Hit] = []
         
-        # 1. Vector Search (Semantic)
-        if use_vector:
-            vector_results = self._vector_search(query, sender_type, n=top_k*2)
-            all_results.extend(vector_results)
+        # Encode the query once for both vector and graph search
+        query_embedding = None
+        if use_vector or (use_graph and sender_type):
+            query_embedding = get_cached_embedding_array(query)
         
-        # 2. Keyword Search (Lexical)
+        # Vector search (Chroma) and BM25 scoring don't use the session, so
+        # they run on worker threads while graph search queries the DB here
+        # (sessions are not thread-safe)
+        vector_future = keyword_future = None
+        if use_vector:
+            vector_future = _search_executor.submit(
+                self._vector_search, query_embedding, sender_type, top_k*2
+            )
         if use_keyword:
-            keyword_results = self._keyword_search(query, sender_type, n=top_k*2)
-            all_results.extend(keyword_results)
+            _ensure_keyword_index(db)
+            keyword_future = _search_executor.submit(
+                self.keyword_searcher.search,
+                query=query,
+                top_k=top_k*2,
+                filter_sender_type=sender_type
+            )
         
         # 3. Graph Search (Precedent)
+        graph_results = []
         if use_graph and sender_type:
-            graph_results = self._graph_search(sender_type, n=top_k)
-            all_results.extend(graph_results)
+            graph_results = self._graph_search(
+                db, sender_type, n=top_k, query_embedding=query_embedding
+            )
+        
+        # 1. Vector Search (Semantic)
+        if vector_future is not None:
+            vector_results = vector_future.result()
+            all_results.extend(vector_results)
         
-        # Deduplicate by ID
-        seen_ids = set()
-        unique_results = []
+        # 2. Keyword Search (Lexical), joined with vector hits on message id
+        if keyword_future is not None:
+            keyword_results = self._keyword_search(
+                db, keyword_future.result(), vector_results=vector_results
+            )
+            all_results.extend(keyword_results)
+        
+        all_results.extend(graph_results)
+        
+        # Deduplicate by ID, keeping the first (highest-priority source) hit
+        by_id = {}
         for result in all_results:
-            if result["id"] not in seen_ids:
-                seen_ids.add(result["id"])
-                unique_results.append(result)
+            by_id.setdefault(result.id, result)
+        unique_results = list(by_id.values())
         
-        # Rerank if enabled
-        if rerank and unique_results:
+        # Rerank if enabled and it can change which results are kept; send
+        # at most the 2*top_k best candidates to the cross-encoder
+        if rerank and len(unique_results) > top_k:
+            if len(unique_results) > 2 * top_k:
+                unique_results = heapq.nlargest(
+                    2 * top_k, unique_results, key=lambda x: x.score
+                )
             unique_results = self.reranker.rerank_with_metadata(
                 query=query,
                 results=unique_results,
-                text_key="text",
+                text_attr="text",
                 top_k=top_k
             )
         else:
             # Just take top-k by original scores
-            unique_results = sorted(
-                unique_results,
-                key=lambda x: x.get("score", 0),
-                reverse=True
-            )[:top_k]
+            unique_results = heapq.nlargest(
+                top_k, unique_results, key=lambda x: x.score
+            )
         
-        return unique_results
+        return [hit.to_dict() for hit in unique_results]
     
     def _vector_search(
         self,
-        query: str,
+        query_embedding: np.ndarray,
         sender_type: Optional[str],
         n: int
-    ) -> List[Dict]:
+    ) -> List[Hit]:
         """Semantic vector search"""
-        query_embedding = get_embedding(query)
-        
-        where_filter = {"sender_type": sender_type} if sender_type else None
+        filter_name = where_filter = None
+        if sender_type in SENDER_TYPE_CONTEXT:
+            filter_name = _sender_filter_name(sender_type)
+        elif sender_type:
+            where_filter = {"sender_type": sender_type}
         
         results = self.vector_store.search(
             query_embedding=query_embedding,
             n_results=n,
-            where=where_filter
+            where=where_filter,
+            filter_name=filter_name
         )
         
         parsed_results = []
@@ -114,83 +231,158 @@ class HybridRetriever:
             results["distances"],
             results["metadatas"]
         ):
-            parsed_results.append({
-                "id": id,
-                "text": doc,
-                "score": 1.0 - dist,  # Convert distance to similarity
-                "metadata": meta,
-                "source": "vector"
-            })
+            parsed_results.append(Hit(
+                id=id,
+                text=doc,
+                score=1.0 - dist,  # Convert distance to similarity
+                metadata=meta,
+                source="vector"
+            ))
         
         return parsed_results
     
     def _keyword_search(
         self,
-        query: str,
-        sender_type: Optional[str],
-        n: int
-    ) -> List[Dict]:
-        """BM25 keyword search"""
-        results = self.keyword_searcher.search(
-            query=query,
-            top_k=n,
-            filter_sender_type=sender_type
-        )
+        db: Session,
+        results: List[Tuple[str, float, Dict]],
+        vector_results: Optional[List[Hit]] = None
+    ) -> List[Hit]:
+        """Turn BM25 keyword hits into results
+        
+        A hit on a message that vector search already returned is fused into
+        that result (weighted score sum) rather than fetched and ranked again.
+        
+        Args:
+            db: Database session
+            results: (doc_id, score, metadata) hits from the keyword searcher
+            vector_results: Vector search results to fuse into
+        """
+        # Best-ranked vector chunk per message (vector results are ordered).
+        # Decision vectors also carry message_id but hold decision text, so
+        # only message chunks (chunk_index in metadata) are fused with
+        vector_by_message = {}
+        for result in vector_results or []:
+            metadata = result.metadata or {}
+            message_id = metadata.get("message_id")
+            if message_id is not None and "chunk_index" in metadata:
+                vector_by_message.setdefault(message_id, result)
         
         parsed_results = []
-        for id, score, meta in results:
-            # Get document text from database
-            message = self.db.query(Message).filter(Message.id == id).first()
-            if message:
-                text = f"From: {message.sender_name}\n{message.content}"
-                parsed_results.append({
-                    "id": id,
-                    "text": text,
-                    "score": float(score) / 100.0,  # Normalize BM25 score
-                    "metadata": meta,
-                    "source": "keyword"
-                })
+        if not results:
+            return parsed_results
+        
+        # Normalize all BM25 scores in one array op
+        ids, raw_scores, metas = zip(*results)
+        scores = (np.asarray(raw_scores, dtype=np.float64) / 100.0).tolist()
+        
+        remaining = []
+        for i, id in enumerate(ids):
+            match = vector_by_message.get(id)
+            if match is not None:
+                match.score = VECTOR_WEIGHT * match.score + KEYWORD_WEIGHT * scores[i]
+                match.source = "hybrid"
+            else:
+                remaining.append(i)
+        
+        if not remaining:
+            return parsed_results
+        
+        # Get document texts from database in one query
+        texts = {
+            row.id: f"From: {row.sender_name}\n{row.content}"
+            for row in db.query(Message.id, Message.sender_name, Message.content)
+            .filter(Message.id.in_([ids[i] for i in remaining]))
+        }
+        
+        for i in remaining:
+            text = texts.get(ids[i])
+            if text is not None:
+                parsed_results.append(Hit(
+                    id=ids[i],
+                    text=text,
+                    score=scores[i],
+                    metadata=metas[i],
+                    source="keyword"
+                ))
         
         return parsed_results
     
     def _graph_search(
         self,
+        db: Session,
         sender_type: str,
-        n: int
-    ) -> List[Dict]:
-        """Graph-based precedent search"""
+        n: int,
+        query_embedding: np.ndarray
+    ) -> List[Hit]:
+        """Graph-based precedent search, ranked by message similarity"""
         # Get past decisions for this sender type
         decisions = (
-            self.db.query(Decision)
+            db.query(Decision)
             .join(Message)
+            .options(
+                # Populate Decision.message from the join above (one JOIN, no
+                # second eager-load join)
+                contains_eager(Decision.message)
+                .defer(Message.embedding)
+                .defer(Message.embedding_q8)
+            )
             .filter(Message.sender_type == sender_type)
             .order_by(Decision.timestamp.desc())
-            .limit(n)
+            .limit(GRAPH_CANDIDATE_POOL)
             .all()
         )
+        if not decisions:
+            return []
+        
+        # Scan the int8 copies, gathered from the contiguous in-memory matrix
+        # rather than re-read per row; each side carries its own scale, so dot * scale_q * scale_row ~= cosine
+        query, query_scale = quantize_int8(query_embedding)
+        embeddings, row_scales = get_message_embedding_matrix().rows(
+            db, [d.message_id for d in decisions]
+        )
+        scores = int8_dot_scores(embeddings, query) * (row_scales * query_scale)
+        
+        # Diversify so near-identical precedents don't crowd out the rest;
+        # candidate-candidate similarities use the same int8 kernel, one row
+        # at a time, so no float32 copy of the matrix is built
+        def similarity(i: int) -> np.ndarray:
+            return int8_dot_scores(embeddings, embeddings[i]) * (row_scales * row_scales[i])
         
         parsed_results = []
-        for decision in decisions:
+        for i in mmr_indices(scores, None, n, GRAPH_MMR_LAMBDA, similarity=similarity):
+            decision = decisions[i]
             message = decision.message
             text = f"Previous decision: {decision.human_action}\nMessage: {message.content}"
             
-            parsed_results.append({
-                "id": decision.id,
-                "text": text,
-                "score": 0.8,  # Fixed relevance for precedent
-                "metadata": {
+            parsed_results.append(Hit(
+                id=decision.id,
+                text=text,
+                score=float(scores[i]),
+                metadata={
                     "decision_id": decision.id,
                     "message_id": message.id,
                     "sender_type": sender_type,
                     "action": decision.human_action.get("action"),
                     "tone": decision.human_action.get("tone")
                 },
-                "source": "graph"
-            })
+                source="graph"
+            ))
         
         return parsed_results
 
 
+# Global instance
+_hybrid_retriever = None
+
+
+def get_hybrid_retriever() -> HybridRetriever:
+    """Get or create hybrid retriever singleton"""
+    global _hybrid_retriever
+    if _hybrid_retriever is None:
+        _hybrid_retriever = HybridRetriever()
+    return _hybrid_retriever
+
+
 def reciprocal_rank_fusion(
     rankings: List[List[str]],
     k: int = 60
@@ -204,15 +396,20 @@ def reciprocal_rank_fusion(
     Returns:
         Fused ranking as list of IDs
     """
-    scores = {}
+    # Dense index per ID, in first-appearance order (ties keep that order)
+    index = {}
+    slots = np.fromiter(
+        (index.setdefault(item_id, len(index)) for ranking in rankings for item_id in ranking),
+        dtype=np.intp
+    )
+    if not index:
+        return []
     
-    for ranking in rankings:
-        for rank, item_id in enumerate(ranking):
-            if item_id not in scores:
-                scores[item_id] = 0
-            scores[item_id] += 1 / (k + rank + 1)
+    # 1 / (k + rank + 1) for every position, summed per ID in one pass
+    ranks = np.concatenate([np.arange(len(ranking)) for ranking in rankings])
+    scores = np.bincount(slots, weights=1.0 / (k + ranks + 1), minlength=len(index))
     
     # Sort by score
-    fused = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    return [item_id for item_id, _ in fused]
+    ids = list(index)
+    return [ids[i] for i in np.argsort(-scores, kind="stable")]
 
@@ -0,0 +1,42 @@
+"""Compiled kernels for retrieval hot paths (Numba optional, NumPy fallback)"""
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _int8_dot_numba(matrix, query):
+        n, d = matrix.shape
+        out = np.empty(n, dtype=np.float32)
+        for i in prange(n):
+            acc = 0
+            for j in range(d):
+                acc += np.int32(matrix[i, j]) * np.int32(query[j])
+            out[i] = acc
+        return out
+
+
+def int8_dot_scores(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Dot products of an int8 matrix (N, d) with an int8 query (d,)
+
+    With Numba the int8 rows are widened inside the loop (int32 accumulate,
+    one pass, parallel over rows), so no float32 copy of the matrix is ever
+    materialized. Without it, falls back to a float32 BLAS matmul, which is
+    exact for these magnitudes.
+
+    Returns:
+        float32 scores (N,)
+    """
+    if len(matrix) == 0:
+        return np.zeros(0, dtype=np.float32)
+    if NUMBA_AVAILABLE:
+        return _int8_dot_numba(
+            np.ascontiguousarray(matrix, dtype=np.int8),
+            np.ascontiguousarray(query, dtype=np.int8)
+        )
+    return matrix.astype(np.float32) @ query.astype(np.float32)
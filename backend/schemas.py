@@ -59,6 +59,18 @@ class DecisionTrace(BaseModel):
         from_attributes = True
 
 
+class DecisionBatchError(BaseModel):
+    """A decision from a batch that could not be stored"""
+    index: int  # Position in the submitted batch
+    message_id: str
+    error: str
+
+
+class DecisionBatchResponse(BaseModel):
+    decisions: List[DecisionTrace]
+    errors: List[DecisionBatchError]
+
+
 class MessageAnalysis(BaseModel):
     """Detailed message analysis from LLM"""
     intent: str
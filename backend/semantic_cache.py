@@ -0,0 +1,115 @@
+"""Semantic cache for agent suggestions on near-duplicate messages"""
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+import copy
+import itertools
+import threading
+
+import numpy as np
+
+from config import get_settings
+
+
+class SemanticCache:
+    """SIM-LRU cache of (embedding, suggestion) pairs, partitioned by key
+
+    A lookup returns the cached suggestion whose embedding is closest to the
+    query, provided the cosine similarity clears the threshold.
+    """
+
+    def __init__(self, threshold: float = 0.97, max_entries: int = 512):
+        """Initialize cache
+
+        Args:
+            threshold: Minimum cosine similarity to count as a hit
+            max_entries: Maximum entries kept per partition (LRU eviction)
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._partitions: Dict[Hashable, "OrderedDict[int, Tuple[np.ndarray, dict]]"] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> Optional[np.ndarray]:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if norm == 0:
+            return None
+        return vec / norm
+
+    def lookup(self, partition: Hashable, embedding) -> Optional[dict]:
+        """Find a cached result for a semantically equivalent input
+
+        Args:
+            partition: Partition key (e.g. sender_type)
+            embedding: Query embedding
+
+        Returns:
+            Copy of the cached result, or None on miss
+        """
+        query = self._normalize(embedding)
+        if query is None:
+            return None
+
+        with self._lock:
+            entries = self._partitions.get(partition)
+            if not entries:
+                return None
+
+            keys = list(entries.keys())
+            matrix = np.stack([entries[k][0] for k in keys])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+
+            key = keys[best]
+            entries.move_to_end(key)
+            return copy.deepcopy(entries[key][1])
+
+    def add(self, partition: Hashable, embedding, result: dict) -> None:
+        """Store a result for later lookups
+
+        Args:
+            partition: Partition key (e.g. sender_type)
+            embedding: Input embedding
+            result: Result dict to cache
+        """
+        vec = self._normalize(embedding)
+        if vec is None:
+            return
+
+        with self._lock:
+            entries = self._partitions.setdefault(partition, OrderedDict())
+            entries[next(self._ids)] = (vec, copy.deepcopy(result))
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, predicate=None) -> None:
+        """Drop cached entries
+
+        Args:
+            predicate: Optional callable on partition keys; only matching
+                partitions are dropped. Drops everything if None.
+        """
+        with self._lock:
+            if predicate is None:
+                self._partitions.clear()
+                return
+            for partition in [p for p in self._partitions if predicate(p)]:
+                del self._partitions[partition]
+
+
+# Global instance
+_suggestion_cache = None
+
+
+def get_suggestion_cache() -> SemanticCache:
+    """Get or create suggestion cache singleton"""
+    global _suggestion_cache
+    if _suggestion_cache is None:
+        _suggestion_cache = SemanticCache(
+            threshold=get_settings().suggestion_cache_threshold
+        )
+    return _suggestion_cache
@@ -1,8 +1,9 @@
 """Test the upgraded intelligent agent"""
 import sys
+import asyncio
 from database import SessionLocal
 from models import Message
-from agent import AgentEngine
+from agent import get_agent_engine
 import json
 
 
@@ -21,7 +22,7 @@ def test_agent_intelligence():
         
         # Initialize agent with LLM
         print("🚀 Initializing AgentEngine with LLM...")
-        agent = AgentEngine(db, use_llm=True)
+        agent = get_agent_engine()
         
         print("\n" + "="*80)
         print("TESTING INTELLIGENT AGENT SUGGESTIONS")
@@ -34,7 +35,7 @@ def test_agent_intelligence():
             print("-" * 80)
             
             # Get suggestion
-            suggestion = agent.get_suggestion(message)
+            suggestion = asyncio.run(agent.get_suggestion(db, message, use_llm=True))
             
             # Display results
             print(f"\n✅ AGENT SUGGESTION:")
@@ -95,11 +96,11 @@ def test_without_llm():
     
     try:
         print("\n🔄 Testing agent WITHOUT LLM (fallback mode)...")
-        agent = AgentEngine(db, use_llm=False)
+        agent = get_agent_engine()
         
         message = db.query(Message).first()
         if message:
-            suggestion = agent.get_suggestion(message)
+            suggestion = asyncio.run(agent.get_suggestion(db, message, use_llm=False))
             print(f"\nFallback suggestion: {suggestion['action']} with {suggestion['tone']} tone")
             print(f"Reasoning: {suggestion['reasoning']}")
         
@@ -123,6 +123,22 @@ def test_api():
         else:
             print("   ℹ️  Not enough precedent yet (need more similar messages)")
     
+    # Test 9: Batch with an unknown message
+    print("\n9️⃣ Testing batch decision capture...")
+    batch = [
+        {**decision_data, "message_id": first_message["id"]},
+        {**decision_data, "message_id": "missing-message-id"},
+    ]
+    response = requests.post(f"{BASE_URL}/decisions/batch", json=batch)
+    assert response.status_code == 200
+    result = response.json()
+    assert len(result["decisions"]) == 1
+    assert result["decisions"][0]["message_id"] == first_message["id"]
+    assert len(result["errors"]) == 1
+    assert result["errors"][0]["index"] == 1
+    assert result["errors"][0]["message_id"] == "missing-message-id"
+    print("   ✅ Stored the known message, reported the unknown one")
+    
     print("\n" + "="*60)
     print("✅ ALL TESTS PASSED!")
     print("="*60)
@@ -0,0 +1,254 @@
+"""Test script for the pure building blocks (no server, model or vector store)
+Run with: python test_core.py
+"""
+from datetime import datetime
+import re
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from semantic_cache import SemanticCache
+from database import Base
+from models import Message, quantize_int8
+from embedding_matrix import MessageEmbeddingMatrix
+from keyword_search import KeywordSearcher, _PUNCTUATION_TABLE
+from embeddings import mmr_indices
+from retriever import reciprocal_rank_fusion
+from agent import AgentEngine, Precedent
+
+
+def test_semantic_cache():
+    """Test partitioning, threshold, LRU eviction and invalidation"""
+    print("\n=== Testing Semantic Cache ===")
+    
+    cache = SemanticCache(threshold=0.95, max_entries=2)
+    cache.add("investor", [1.0, 0.0, 0.0], {"action": "reply_now"})
+    
+    # Near-duplicate hits, dissimilar misses, other partitions never match
+    assert cache.lookup("investor", [0.99, 0.05, 0.0]) == {"action": "reply_now"}
+    assert cache.lookup("investor", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("sales", [1.0, 0.0, 0.0]) is None
+    print("✅ Threshold and partitions respected")
+    
+    # Hits are copies; mutating one doesn't change the cached entry
+    hit = cache.lookup("investor", [1.0, 0.0, 0.0])
+    hit["action"] = "ignore"
+    assert cache.lookup("investor", [1.0, 0.0, 0.0]) == {"action": "reply_now"}
+    
+    # Zero vectors are neither stored nor matched
+    cache.add("investor", [0.0, 0.0, 0.0], {"action": "ignore"})
+    assert cache.lookup("investor", [0.0, 0.0, 0.0]) is None
+    
+    # Least recently used entry goes first once the partition is full
+    cache.add("investor", [0.0, 1.0, 0.0], {"action": "schedule"})
+    cache.lookup("investor", [1.0, 0.0, 0.0])
+    cache.add("investor", [0.0, 0.0, 1.0], {"action": "delegate"})
+    assert cache.lookup("investor", [1.0, 0.0, 0.0]) == {"action": "reply_now"}
+    assert cache.lookup("investor", [0.0, 1.0, 0.0]) is None
+    print("✅ LRU eviction per partition")
+    
+    # Invalidation drops only matching partitions, or everything
+    cache.add("sales", [1.0, 0.0, 0.0], {"action": "ignore"})
+    cache.invalidate(lambda partition: partition == "investor")
+    assert cache.lookup("investor", [1.0, 0.0, 0.0]) is None
+    assert cache.lookup("sales", [1.0, 0.0, 0.0]) == {"action": "ignore"}
+    cache.invalidate()
+    assert cache.lookup("sales", [1.0, 0.0, 0.0]) is None
+    print("✅ Invalidation by partition and in full")
+
+
+def test_quantize_int8():
+    """Test int8 round-trip, per-vector scale and dot-product accuracy"""
+    print("\n=== Testing int8 Quantization ===")
+    
+    rng = np.random.default_rng(0)
+    a, b = rng.standard_normal((2, 384)).astype(np.float32)
+    unit_a = a / np.linalg.norm(a)
+    unit_b = b / np.linalg.norm(b)
+    
+    q, scale = quantize_int8(a)
+    assert q.dtype == np.int8 and q.shape == a.shape
+    # The largest component uses the full range; q * scale recovers the unit vector
+    assert np.abs(q).max() == 127
+    assert np.isclose(scale, np.abs(unit_a).max() / 127)
+    assert np.abs(q * scale - unit_a).max() <= scale / 2 + 1e-7
+    print(f"✅ Round-trip error within half a step (scale {scale:.5f})")
+    
+    # Scaled int8 dot products approximate cosine similarity
+    q_b, scale_b = quantize_int8(b)
+    approx = float(q.astype(np.int32) @ q_b.astype(np.int32)) * scale * scale_b
+    assert abs(approx - float(unit_a @ unit_b)) < 1e-2
+    
+    # Zero vectors quantize to zeros with a zero scale
+    q_zero, scale_zero = quantize_int8(np.zeros(4))
+    assert not q_zero.any() and scale_zero == 0.0
+    print("✅ Cosine similarity preserved, zero vector handled")
+
+
+def test_mmr_indices():
+    """Test MMR relevance/diversity trade-off and the similarity callback"""
+    print("\n=== Testing MMR Selection ===")
+    
+    # Candidates 0 and 1 are duplicates; 2 is less relevant but different
+    matrix = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+    scores = np.array([1.0, 0.99, 0.5], dtype=np.float32)
+    
+    assert mmr_indices(scores, matrix, 2, lambda_=1.0).tolist() == [0, 1]
+    assert mmr_indices(scores, matrix, 2, lambda_=0.5).tolist() == [0, 2]
+    print("✅ lambda=1 is plain top-k, lower lambda skips the duplicate")
+    
+    # k is clamped to the candidate count; k=0 selects nothing
+    assert sorted(mmr_indices(scores, matrix, 10).tolist()) == [0, 1, 2]
+    assert mmr_indices(scores, matrix, 0).tolist() == []
+    
+    # A similarity callback (int8 rows) picks the same as the float matrix
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((20, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    relevance = vectors @ vectors[0]
+    expected = mmr_indices(relevance, vectors, 5)
+    assert mmr_indices(
+        relevance, None, 5, similarity=lambda i: vectors @ vectors[i]
+    ).tolist() == expected.tolist()
+    print("✅ Similarity callback matches the matrix path")
+
+
+def test_dedupe_precedents():
+    """Test that repeated precedents collapse to the newest, in retrieval order"""
+    print("\n=== Testing Precedent Dedupe ===")
+    
+    def precedent(id, action, tone, sender_name, day):
+        return Precedent(
+            id=id,
+            human_action={"action": action, "tone": tone},
+            timestamp=datetime(2024, 1, day),
+            sender_name=sender_name,
+            sender_type="investor",
+            snippet=""
+        )
+    
+    older = precedent("p1", "reply_now", "warm", "Sarah", 1)
+    newer = precedent("p2", "reply_now", "warm", "Sarah", 2)
+    other_tone = precedent("p3", "reply_now", "formal", "Sarah", 1)
+    other_sender = precedent("p4", "reply_now", "warm", "Mike", 1)
+    
+    kept = AgentEngine()._dedupe_precedents([older, other_tone, newer, other_sender])
+    assert [p.id for p in kept] == ["p3", "p2", "p4"]
+    print(f"✅ Kept {[p.id for p in kept]} (newest per action, tone and sender)")
+
+
+def test_message_embedding_matrix():
+    """Test that the int8 matrix grows, keeps rows stable and zero-fills gaps"""
+    print("\n=== Testing Message Embedding Matrix ===")
+    
+    # In-memory SQLite database with the app's tables
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((5, 8)).astype(np.float32)
+    for i, vector in enumerate(vectors):
+        db.add(Message(
+            id=f"m{i}", sender_name="Sarah", sender_type="investor",
+            channel="email", content="test", embedding=vector
+        ))
+    db.add(Message(
+        id="m_none", sender_name="Mike", sender_type="sales",
+        channel="email", content="test", embedding=None
+    ))
+    db.commit()
+    
+    matrix = MessageEmbeddingMatrix(dim=8, capacity=2)
+    matrix.rows(db, ["m0", "m1"])
+    assert matrix.size == 2 and len(matrix.q8) == 2
+    
+    # Loading past capacity doubles it; earlier rows keep their positions
+    ids = ["m4", "m_none", "m0", "missing", "m2", "m3", "m1"]
+    q8, scales = matrix.rows(db, ids)
+    assert matrix.size == 5 and len(matrix.q8) == 8
+    assert matrix.row_of["m0"] == 0 and matrix.row_of["m1"] == 1
+    print(f"✅ Grew to {len(matrix.q8)} rows for {matrix.size} messages")
+    
+    for row, message_id in enumerate(ids):
+        if message_id in ("m_none", "missing"):
+            assert not q8[row].any() and scales[row] == 0
+            continue
+        expected_q8, expected_scale = quantize_int8(vectors[int(message_id[1:])])
+        assert np.array_equal(q8[row], expected_q8)
+        assert np.isclose(scales[row], expected_scale)
+    print("✅ Rows match the stored int8 embeddings (zero rows for gaps)")
+    
+    db.close()
+
+
+def test_reciprocal_rank_fusion():
+    """Test RRF ordering against the plain dict formula"""
+    print("\n=== Testing Reciprocal Rank Fusion ===")
+    
+    # b is 2nd then 1st, a is 1st then 3rd: b edges out a
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]]) == ["b", "a", "c"]
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], []]) == []
+    
+    # Same order as the textbook dict accumulation on random rankings
+    rng = np.random.default_rng(0)
+    items = [f"doc_{i}" for i in range(30)]
+    rankings = [list(rng.choice(items, size=10, replace=False)) for _ in range(4)]
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (60 + rank + 1)
+    fused = reciprocal_rank_fusion(rankings)
+    assert sorted(fused) == sorted(scores)
+    fused_scores = [scores[item] for item in fused]
+    assert all(x >= y - 1e-12 for x, y in zip(fused_scores, fused_scores[1:]))
+    print(f"✅ Fused {len(rankings)} rankings into {len(fused)} items")
+
+
+def test_tokenizer_matches_regex():
+    """Test the str.translate tokenizer against the regex it replaced"""
+    print("\n=== Testing Keyword Tokenizer ===")
+    
+    def regex_tokenize(text):
+        text = re.sub(r'[^\w\s\-@.]', ' ', text.lower())
+        return [t for t in text.split() if len(t) > 1]
+    
+    # Every Basic Multilingual Plane character (surrogates can't be encoded)
+    chars = "".join(chr(c) for c in range(0x10000) if not 0xD800 <= c <= 0xDFFF)
+    assert chars.translate(_PUNCTUATION_TABLE) == re.sub(r'[^\w\s\-@.]', ' ', chars)
+    print(f"✅ Punctuation table matches the regex on {len(chars)} characters")
+    
+    texts = [
+        "Hi Sarah! Can we discuss Q4 metrics (ARR, churn) by Friday?",
+        "Email mike@acme.io re: enterprise-tier pricing... ASAP!!",
+        "Café résumé naïve — 東京 meeting @ 3pm; ok?",
+        "🚀 Launch update: v2.0 is live #shipit",
+        "",
+    ]
+    for text in texts:
+        assert KeywordSearcher._tokenize(text) == regex_tokenize(text), text
+    print("✅ Tokens match the regex tokenizer")
+
+
+if __name__ == "__main__":
+    print("🧪 Running Core Tests...\n")
+    
+    try:
+        test_semantic_cache()
+        test_quantize_int8()
+        test_mmr_indices()
+        test_dedupe_precedents()
+        test_message_embedding_matrix()
+        test_reciprocal_rank_fusion()
+        test_tokenizer_matches_regex()
+    
+        print("\n" + "="*50)
+        print("✅ ALL TESTS PASSED!")
+        print("="*50)
+    
+    except Exception as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        import traceback
+        traceback.print_exc()
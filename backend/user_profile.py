@@ -1,6 +1,24 @@
 """User profile for storing writing style preferences"""
-from sqlalchemy import Column, String, JSON, Float
+from sqlalchemy import Column, String, Float, LargeBinary
+from sqlalchemy.types import TypeDecorator
 from database import Base
+import msgpack
+
+
+class Msgpack(TypeDecorator):
+    """JSON-compatible value stored as msgpack bytes (smaller, faster to decode)"""
+    impl = LargeBinary
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return msgpack.packb(value, use_bin_type=True)
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return msgpack.unpackb(value, raw=False)
 
 
 class UserProfile(Base):
@@ -15,11 +33,11 @@ class UserProfile(Base):
     emoji_usage = Column(Float, default=0.0)  # 0=never, 1=always
     
     # Preferences by sender type
-    sender_preferences = Column(JSON, default=dict)  # {investor: {tone: warm, ...}}
+    sender_preferences = Column(Msgpack, default=dict)  # {investor: {tone: warm, ...}}
     
     # Common patterns
-    common_greetings = Column(JSON, default=list)  # ["Hey", "Hi there"]
-    common_signoffs = Column(JSON, default=list)  # ["Best", "Cheers"]
+    common_greetings = Column(Msgpack, default=list)  # ["Hey", "Hi there"]
+    common_signoffs = Column(Msgpack, default=list)  # ["Best", "Cheers"]
     
     # Edit patterns
     tends_to_shorten = Column(Float, default=0.0)  # -1 to 1
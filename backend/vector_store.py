@@ -1,45 +1,236 @@
 """Vector store using ChromaDB for semantic search"""
 import chromadb
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
 from chromadb.config import Settings
-from typing import List, Dict, Optional
+from cachetools import TTLCache
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Union
+import numpy as np
+import atexit
+import hashlib
+import json
+import logging
 import os
+import threading
+
+from config import get_settings
+from embeddings import get_cached_embeddings_batch
+
+logger = logging.getLogger(__name__)
+
+# HNSW index settings for the collection. M and construction_ef are fixed
+# when the collection is created (reset(hard=True) re-creates it with the current
+# values); memory per vector grows roughly linearly with M.
+DEFAULT_HNSW_CONFIG = {
+    "hnsw:space": "cosine",  # Use cosine similarity
+    "hnsw:M": 24,
+    "hnsw:construction_ef": 128,
+    "hnsw:search_ef": 100,
+    "hnsw:batch_size": 1000,
+    "hnsw:sync_threshold": 2000
+}
+
+# Queued background writes before store_batch blocks the caller
+MAX_PENDING_WRITES = 8
+
+# Fields returned by searches (never the stored embeddings)
+QUERY_INCLUDE = ["documents", "distances", "metadatas"]
+
+# Fields returned by lightweight searches (ids are always returned)
+LIGHTWEIGHT_INCLUDE = ["distances"]
+
+# Range operators; filters using them (time windows) are not cached
+_RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+
+# Metadata fields search() accepts in where filters. Chroma applies the
+# filter before the HNSW query (matching IDs are passed to the index), so
+# selective filters don't need over-fetching. Timestamp ranges are run
+# against the numeric timestamp_epoch field written alongside "timestamp".
+FILTERABLE_FIELDS = (
+    "sender_type", "sender_name", "channel", "message_id", "decision_id",
+    "action", "tone", "timestamp"
+)
+
+
+def _as_float32(embeddings) -> np.ndarray:
+    """Embeddings (lists or arrays) as one contiguous float32 array"""
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+def _report_write_error(future: Future) -> None:
+    """Print failures of background writes (no caller may be waiting)"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Vector store write failed: %s", future.exception())
+
+
+def _to_epoch(value) -> int:
+    """Seconds since the epoch for a datetime, ISO string or number (naive = UTC)"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _with_epoch(metadata: Optional[Dict]) -> Optional[Dict]:
+    """Metadata plus a numeric timestamp_epoch when it has a parseable timestamp"""
+    if not metadata or "timestamp" not in metadata or "timestamp_epoch" in metadata:
+        return metadata
+    try:
+        return {**metadata, "timestamp_epoch": _to_epoch(metadata["timestamp"])}
+    except (TypeError, ValueError, AttributeError):
+        return metadata
+
+
+def _normalize_where(where: Optional[Dict]) -> Optional[Dict]:
+    """Validate where keys against FILTERABLE_FIELDS; map timestamp ranges to epochs
+    
+    Raises:
+        ValueError: On a field that isn't filterable
+    """
+    if not where:
+        return where
+    normalized = {}
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            normalized[key] = [_normalize_where(clause) for clause in value]
+        elif key not in FILTERABLE_FIELDS:
+            raise ValueError(f"Cannot filter on metadata field '{key}'")
+        elif (
+            key == "timestamp" and isinstance(value, dict)
+            and any(op in value for op in _RANGE_OPERATORS)
+        ):
+            normalized["timestamp_epoch"] = {
+                op: _to_epoch(bound) for op, bound in value.items()
+            }
+        else:
+            normalized[key] = value
+    return normalized
+
+
+@dataclass(frozen=True, slots=True)
+class PreparedFilter:
+    """A where filter validated and canonicalized once (see prepare_filter)"""
+    where: Dict
+    cache_key: str
+    cacheable: bool
+
+
+def _has_range_filter(where: Optional[Dict]) -> bool:
+    """True if a where filter uses a range comparison anywhere"""
+    if not where:
+        return False
+    text = json.dumps(where, default=str)
+    return any(f'"{op}"' in text for op in _RANGE_OPERATORS)
+
+
+def _is_contiguous_array_error(error: Exception) -> bool:
+    """hnswlib's "Cannot return the results in a contigious 2D array" error"""
+    message = str(error)
+    return "contigious" in message or "contiguous" in message
+
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """Chroma embedding function backed by the app's model and embedding cache
+    
+    Lets Chroma embed documents itself on writes without loading a second
+    copy of the model, and reuses vectors already in the cache.
+    """
+    
+    def __call__(self, input: Documents) -> Embeddings:
+        return get_cached_embeddings_batch(list(input)).tolist()
 
 
 class VectorStore:
-    """ChromaDB wrapper for message embeddings"""
+    """ChromaDB wrapper for message embeddings
+    
+    Chroma indexes the collection with hnswlib (HNSW graph, cosine space),
+    so search() is an approximate O(log N) lookup, not a flat scan; where
+    filters are applied inside the index query.
+    """
     
-    def __init__(self, persist_directory: str = "./chroma_db"):
-        """Initialize ChromaDB client with persistence"""
+    def __init__(
+        self,
+        persist_directory: str = "./chroma_db",
+        hnsw_config: Optional[Dict] = None,
+        host: Optional[str] = None,
+        port: int = 8000,
+        query_cache_size: int = 256,
+        query_cache_ttl: float = 60.0
+    ):
+        """Initialize ChromaDB client with persistence
+        
+        Args:
+            persist_directory: Where embedded Chroma keeps its data
+            hnsw_config: Overrides for DEFAULT_HNSW_CONFIG ("hnsw:*" keys)
+            host: Chroma server to connect to; None runs Chroma in-process
+            port: Chroma server port
+            query_cache_size: Search results kept for repeated queries (0 = off)
+            query_cache_ttl: Seconds a cached search result stays valid
+        """
         self.persist_directory = persist_directory
+        self.hnsw_config = {**DEFAULT_HNSW_CONFIG, **(hnsw_config or {})}
         
-        # Create directory if it doesn't exist
-        os.makedirs(persist_directory, exist_ok=True)
+        # HNSW inserts are not thread-safe: every write goes through one
+        # writer thread, so ingestion can overlap with the caller's work
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector-store-writer")
+        self._inflight = deque()
+        self._inflight_lock = threading.Lock()
         
-        # Initialize client with persistence
-        self.client = chromadb.PersistentClient(
-            path=persist_directory,
-            settings=Settings(
-                anonymized_telemetry=False,
-                allow_reset=True
-            )
+        # Recent search results, cleared on every write or delete
+        self._query_cache = (
+            TTLCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+            if query_cache_size else None
         )
+        self._query_cache_lock = threading.Lock()
+        # Bumped on every invalidation; a search only caches its result if
+        # no write landed while its query ran
+        self._query_generation = 0
+        
+        # Named filters prepared once and reused by search(filter_name=...)
+        self._filters: Dict[str, PreparedFilter] = {}
+        
+        settings = Settings(
+            anonymized_telemetry=False,
+            allow_reset=True
+        )
+        if host:
+            # Client-server mode: index search runs in the server process,
+            # so concurrent searches don't contend on this process's GIL
+            self.client = chromadb.HttpClient(host=host, port=port, settings=settings)
+        else:
+            # Create directory if it doesn't exist
+            os.makedirs(persist_directory, exist_ok=True)
+            
+            # Initialize client with persistence
+            self.client = chromadb.PersistentClient(
+                path=persist_directory,
+                settings=settings
+            )
         
         # Get or create collection
+        self.embedding_function = CachedEmbeddingFunction()
         self.collection = self.client.get_or_create_collection(
             name="messages",
-            metadata={"hnsw:space": "cosine"}  # Use cosine similarity
+            metadata=self.hnsw_config,
+            embedding_function=self.embedding_function
         )
         
-        print(f"Vector store initialized: {self.collection.count()} documents")
+        logger.info("Vector store initialized at %s", host or persist_directory)
     
     def store(
         self,
         id: str,
         text: str,
-        embedding: List[float],
+        embedding: Union[List[float], np.ndarray],
         metadata: Optional[Dict] = None
     ) -> None:
-        """Store a document with its embedding
+        """Store a document with its embedding (replaces an existing ID)
         
         Args:
             id: Unique document ID
@@ -47,97 +238,404 @@ class VectorStore:
             embedding: Pre-computed embedding vector
             metadata: Optional metadata (sender_type, timestamp, etc.)
         """
-        self.collection.add(
-            ids=[id],
-            documents=[text],
-            embeddings=[embedding],
-            metadatas=[metadata] if metadata else None
-        )
+        try:
+            self._writer.submit(
+                self.collection.upsert,
+                ids=[id],
+                documents=[text],
+                embeddings=[_as_float32(embedding).tolist()],
+                metadatas=[_with_epoch(metadata)] if metadata else None
+            ).result()
+        finally:
+            self._invalidate_queries()
     
     def store_batch(
         self,
         ids: List[str],
-        texts: List[str],
-        embeddings: List[List[float]],
-        metadatas: Optional[List[Dict]] = None
-    ) -> None:
-        """Store multiple documents at once"""
-        self.collection.add(
-            ids=ids,
-            documents=texts,
-            embeddings=embeddings,
-            metadatas=metadatas
+        texts: Optional[List[str]],
+        embeddings: Optional[Union[List[List[float]], np.ndarray]] = None,
+        metadatas: Optional[List[Dict]] = None,
+        batch_size: Optional[int] = None,
+        asynchronous: bool = True
+    ) -> Optional[Future]:
+        """Store multiple documents at once, replacing existing IDs
+        
+        Each upsert() is one transaction; inputs are split into sub-batches of
+        batch_size (default: the index's hnsw:batch_size), never more than
+        the client's max batch size. Without embeddings, the collection
+        embeds each batch itself.
+        
+        Embeddings are held as one (N, D) float32 array; Chroma 0.4 only
+        accepts lists, so each sub-batch is converted as it is written.
+        
+        Args:
+            texts: Document texts; None stores ids, embeddings and metadata
+                only (embeddings are then required)
+            asynchronous: Queue the write on the writer thread and return
+                its Future (call flush() to wait for all queued writes);
+                if False, block until stored and raise on failure
+        """
+        if embeddings is not None and len(embeddings):
+            embeddings = _as_float32(embeddings)
+        else:
+            embeddings = None
+        if texts is None and embeddings is None:
+            raise ValueError("store_batch needs texts or embeddings")
+        step = batch_size or self.hnsw_config.get("hnsw:batch_size") or len(ids) or 1
+        max_batch_size = getattr(self.client, "max_batch_size", None)
+        if max_batch_size:
+            step = min(step, max_batch_size)
+        
+        future = self._writer.submit(
+            self._add_batches, ids, texts, embeddings, metadatas, step
         )
+        if not asynchronous:
+            future.result()
+            return None
+        
+        future.add_done_callback(_report_write_error)
+        self._track(future)
+        return future
+    
+    def _add_batches(
+        self,
+        ids: List[str],
+        texts: Optional[List[str]],
+        embeddings: Optional[np.ndarray],
+        metadatas: Optional[List[Dict]],
+        step: int
+    ) -> None:
+        """Write documents in upsert() calls of at most step items (writer thread)"""
+        try:
+            for start in range(0, len(ids), step):
+                end = start + step
+                self.collection.upsert(
+                    ids=ids[start:end],
+                    documents=texts[start:end] if texts is not None else None,
+                    embeddings=embeddings[start:end].tolist() if embeddings is not None else None,
+                    metadatas=[_with_epoch(m) for m in metadatas[start:end]] if metadatas else None
+                )
+        finally:
+            self._invalidate_queries()
+    
+    def _track(self, future: Future) -> None:
+        """Remember a queued write; block on the oldest when too many are queued"""
+        with self._inflight_lock:
+            while self._inflight and self._inflight[0].done():
+                self._inflight.popleft()
+            self._inflight.append(future)
+            oldest = self._inflight[0] if len(self._inflight) > MAX_PENDING_WRITES else None
+        if oldest is not None:
+            wait([oldest])
+    
+    def flush(self) -> None:
+        """Wait until every queued write has finished
+        
+        Failures are reported through each write's Future, not raised here.
+        """
+        with self._inflight_lock:
+            pending = list(self._inflight)
+            self._inflight.clear()
+        wait(pending)
     
     def search(
         self,
-        query_embedding: List[float],
+        query_embedding: Union[List[float], np.ndarray],
         n_results: int = 5,
-        where: Optional[Dict] = None
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        lightweight: bool = False,
+        filter_name: Optional[str] = None
     ) -> Dict:
         """Search for similar documents
         
         Args:
             query_embedding: Query vector
             n_results: Number of results to return
-            where: Filter conditions (e.g., {"sender_type": "investor"})
+            where: Filter conditions on FILTERABLE_FIELDS (e.g.,
+                {"sender_type": "investor"}); timestamp accepts ranges
+                ({"$gte": datetime or ISO string})
+            include: Fields to fetch (default: documents, distances, metadatas)
+            lightweight: Fetch only ids and distances
+            filter_name: Filter registered with prepare_filter (instead of where)
             
         Returns:
-            Dict with ids, documents, distances, metadatas
+            Dict with ids, documents, distances, metadatas (fields not
+            fetched are empty lists; shared with the query cache, treat as
+            read-only)
         """
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            where=where
-        )
+        if include is None:
+            include = LIGHTWEIGHT_INCLUDE if lightweight else QUERY_INCLUDE
+        prepared = self._filters[filter_name] if filter_name else self._prepare(where)
+        where = prepared.where or None
+        query = _as_float32(query_embedding)
+        cache_key = None
+        if self._query_cache is not None and prepared.cacheable:
+            cache_key = (
+                hashlib.blake2b(query.tobytes(), digest_size=16).digest(),
+                n_results,
+                prepared.cache_key,
+                tuple(include)
+            )
+            with self._query_cache_lock:
+                cached = self._query_cache.get(cache_key)
+                generation = self._query_generation
+            if cached is not None:
+                return cached
         
-        return {
+        results = self._query([query.tolist()], n_results, where, include)
+        if results is None:
+            return {"ids": [], "documents": [], "distances": [], "metadatas": []}
+        
+        parsed = {
             "ids": results["ids"][0] if results["ids"] else [],
             "documents": results["documents"][0] if results["documents"] else [],
             "distances": results["distances"][0] if results["distances"] else [],
             "metadatas": results["metadatas"][0] if results["metadatas"] else []
         }
+        if cache_key is not None:
+            with self._query_cache_lock:
+                if generation == self._query_generation:
+                    self._query_cache[cache_key] = parsed
+        return parsed
+    
+    def prepare_filter(self, name: str, where: Dict) -> PreparedFilter:
+        """Validate and canonicalize a where filter once, under a name
+        
+        search(filter_name=name) then skips per-call validation and
+        cache-key serialization. Re-preparing an existing name keeps the
+        first registration.
+        
+        Raises:
+            ValueError: On a field that isn't filterable
+        """
+        prepared = self._filters.get(name)
+        if prepared is None:
+            prepared = self._filters.setdefault(name, self._prepare(where))
+        return prepared
+    
+    @staticmethod
+    def _prepare(where: Optional[Dict]) -> PreparedFilter:
+        """Normalized filter with its query-cache key"""
+        normalized = _normalize_where(where) or {}
+        return PreparedFilter(
+            where=normalized,
+            cache_key=json.dumps(normalized, sort_keys=True, default=str),
+            cacheable=not _has_range_filter(normalized)
+        )
+    
+    def _invalidate_queries(self) -> None:
+        """Drop cached search results after the collection changed"""
+        if self._query_cache is not None:
+            with self._query_cache_lock:
+                self._query_generation += 1
+                self._query_cache.clear()
+    
+    def search_batch(
+        self,
+        query_embeddings: Union[List[List[float]], np.ndarray],
+        n_results: int = 5,
+        where: Optional[Dict] = None
+    ) -> List[Dict]:
+        """Search for several query vectors in one collection.query call
+        
+        Args:
+            query_embeddings: Query vectors (N, D)
+            n_results: Number of results per query
+            where: Filter conditions applied to every query
+            
+        Returns:
+            One dict per query, shaped like search()
+        """
+        matrix = _as_float32(query_embeddings)
+        if len(matrix) == 0:
+            return []
+        where = _normalize_where(where)
+        
+        results = self._query(matrix.tolist(), n_results, where, QUERY_INCLUDE)
+        if results is None:
+            return [
+                {"ids": [], "documents": [], "distances": [], "metadatas": []}
+                for _ in range(len(matrix))
+            ]
+        
+        return [
+            {
+                "ids": ids,
+                "documents": documents,
+                "distances": distances,
+                "metadatas": metadatas
+            }
+            for ids, documents, distances, metadatas in zip(
+                results["ids"],
+                results["documents"],
+                results["distances"],
+                results["metadatas"]
+            )
+        ]
+    
+    def _query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int,
+        where: Optional[Dict],
+        include: List[str]
+    ) -> Optional[Dict]:
+        """Run collection.query, recovering from hnswlib's short-result error
+        
+        When hnswlib finds fewer than n_results neighbours (sparse graph or
+        narrow filter), retries asking for fewer, bounded by the index size.
+        
+        Returns:
+            Raw Chroma query result, or None if nothing could be returned
+        """
+        try:
+            return self.collection.query(
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+                where=where,
+                include=include
+            )
+        except RuntimeError as e:
+            if not _is_contiguous_array_error(e):
+                raise
+        
+        n = min(n_results, self.count()) // 2
+        while n > 0:
+            try:
+                return self.collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=n,
+                    where=where,
+                    include=include
+                )
+            except RuntimeError as e:
+                if not _is_contiguous_array_error(e):
+                    raise
+                n //= 2
+        return None
     
     def get(self, id: str) -> Optional[Dict]:
         """Get a document by ID"""
+        return self.get_many([id]).get(id)
+    
+    def get_many(self, ids: List[str]) -> Dict[str, Dict]:
+        """Get several documents in one call
+        
+        Args:
+            ids: Document IDs
+            
+        Returns:
+            Dict of id -> {id, document, metadata}; missing IDs are absent
+        """
+        if not ids:
+            return {}
         try:
-            result = self.collection.get(ids=[id])
-            if result["ids"]:
-                return {
-                    "id": result["ids"][0],
-                    "document": result["documents"][0],
-                    "metadata": result["metadatas"][0] if result["metadatas"] else None
-                }
+            result = self.collection.get(ids=ids, include=["documents", "metadatas"])
         except Exception:
-            pass
-        return None
+            return {}
+        
+        metadatas = result["metadatas"] or [None] * len(result["ids"])
+        return {
+            id: {"id": id, "document": document, "metadata": metadata}
+            for id, document, metadata in zip(result["ids"], result["documents"], metadatas)
+        }
+    
+    def missing_ids(self, ids: List[str]) -> List[str]:
+        """IDs from ids that are not in the store (lists IDs only, no payloads)"""
+        if not ids:
+            return []
+        present = set(self.collection.get(ids=ids, include=[])["ids"])
+        return [id for id in ids if id not in present]
     
     def delete(self, id: str) -> None:
         """Delete a document by ID"""
         self.collection.delete(ids=[id])
+        self._invalidate_queries()
     
-    def reset(self) -> None:
-        """Clear all documents"""
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every document whose ID starts with prefix
+        
+        Chroma has no ID-prefix filter, so this lists IDs only (no
+        embeddings, documents or metadata are loaded) and deletes the
+        matches in as few calls as the client allows.
+        
+        Returns:
+            Number of documents deleted
+        """
+        self.flush()
+        ids = [id for id in self.collection.get(include=[])["ids"] if id.startswith(prefix)]
+        step = getattr(self.client, "max_batch_size", None) or len(ids) or 1
+        for start in range(0, len(ids), step):
+            self.collection.delete(ids=ids[start:start + step])
+        self._invalidate_queries()
+        return len(ids)
+    
+    def reset(self, hard: bool = False) -> None:
+        """Clear all documents
+        
+        Args:
+            hard: Drop and re-create the collection instead of deleting its
+                documents in place; needed to apply changed HNSW build
+                parameters (M, construction_ef)
+        """
+        if not hard:
+            self.delete_prefix("")
+            logger.info("Vector store reset complete")
+            return
+        
+        self.flush()
         self.client.delete_collection(name="messages")
         self.collection = self.client.create_collection(
             name="messages",
-            metadata={"hnsw:space": "cosine"}
+            metadata=self.hnsw_config,
+            embedding_function=self.embedding_function
         )
-        print("Vector store reset complete")
+        self._invalidate_queries()
+        logger.info("Vector store reset complete (collection re-created)")
     
     def count(self) -> int:
-        """Get total document count"""
+        """Get total document count (a count query; not free on large stores)"""
         return self.collection.count()
+    
+    @property
+    def size(self) -> int:
+        """Total document count, computed on access"""
+        return self.count()
+    
+    def close(self) -> None:
+        """Finish queued writes and stop the writer thread"""
+        self.flush()
+        self._writer.shutdown(wait=True)
+    
+    def __enter__(self) -> "VectorStore":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
 
 
 # Global instance
 _vector_store = None
+_vector_store_lock = threading.Lock()
 
 
 def get_vector_store() -> VectorStore:
-    """Get or create vector store singleton"""
+    """Get or create vector store singleton
+    
+    Locked so concurrent first calls can't open two clients on the same
+    persist directory; queued writes are flushed at interpreter exit.
+    """
     global _vector_store
     if _vector_store is None:
-        _vector_store = VectorStore()
+        with _vector_store_lock:
+            if _vector_store is None:
+                settings = get_settings()
+                store = VectorStore(
+                    host=settings.chroma_host or None,
+                    port=settings.chroma_port
+                )
+                atexit.register(store.close)
+                _vector_store = store
     return _vector_store
 
@@ -40,7 +40,7 @@ echo "Next steps:"
 echo "1. Make sure PostgreSQL is running"
 echo "2. Create database: createdb inbox_context_graph"
 echo "3. Add OPENAI_API_KEY to backend/.env (optional but recommended)"
-echo "4. Initialize database: cd backend && python init_db.py"
+echo "4. Initialize database: cd backend && alembic upgrade head && python init_db.py"
 echo "5. Start backend: cd backend && source venv/bin/activate && uvicorn main:app --reload"
 echo "6. Start frontend: cd frontend && npm run dev"
 echo ""